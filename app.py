@@ -1,109 +1,71 @@
 import streamlit as st
-from openai import OpenAI
-from PIL import Image
-import requests
-from io import BytesIO
 import datetime
-import base64
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional
 import time
-import random
-import json
 import uuid
-import os
-import re
-from urllib.parse import urlencode, quote
 import gc
+import functools
 from streamlit.errors import StreamlitAPIException, StreamlitSecretNotFoundError
+from flux_core import (API_PROVIDERS, BASE_FLUX_MODELS, DEFAULT_API_PROFILES, IMAGE_SIZES, MAX_BATCH_SIZE, MAX_SEED, STYLE_PRESETS, build_final_prompt,
+                       fetch_model_ids, get_client_registry, get_generation_queue, get_image_store, get_max_concurrency, get_model_cache, get_result_cache,
+                       get_scheduler, invalidate_model_caches, is_cacheable, models_from_ids, validate_api_key, credential_key, deep_sizeof, get_metrics,
+                       SWEEP_AXES, build_sweep_cells, estimate_sweep, parse_seeds, plan_sweep, submit_sweep)
+from flux_core.config import IMAGE_STORE_MAX_BYTES, METRICS_EXPORT_DIR, METRICS_EXPORT_INTERVAL, QUEUE_POLL_INTERVAL, SWEEP_MAX_CELLS
 
 # 為免費方案設定限制
 MAX_HISTORY_ITEMS = 15
 MAX_FAVORITE_ITEMS = 30
-MAX_BATCH_SIZE = 4
-
-# 圖像尺寸預設
-IMAGE_SIZES = {
-    "自定義...": "Custom", "1024x1024": "正方形 (1:1)", "1080x1080": "IG 貼文 (1:1)",
-    "1080x1350": "IG 縱向 (4:5)", "1080x1920": "IG Story (9:16)", "1200x630": "FB 橫向 (1.91:1)",
-}
-
-# 風格預設
-STYLE_PRESETS = {
-    # 基礎風格
-    "無": "", "電影感": "cinematic, dramatic lighting, high detail, sharp focus, epic",
-    "動漫風": "anime, manga style, vibrant colors, clean line art, studio ghibli", "賽博龐克": "cyberpunk, neon lights, futuristic city, high-tech, Blade Runner",
-    # 藝術流派
-    "印象派": "impressionism, soft light, visible brushstrokes, Monet style", "超現實主義": "surrealism, dreamlike, bizarre, Salvador Dali style",
-    "普普藝術": "pop art, bold colors, comic book style, Andy Warhol", "水墨畫": "ink wash painting, traditional chinese art, minimalist, zen",
-    # 數位與遊戲風格
-    "3D 模型": "3d model, octane render, unreal engine, hyperdetailed, 4k", "像素藝術": "pixel art, 16-bit, retro gaming style, sprite sheet",
-    "低面建模": "low poly, simple shapes, vibrant color palette, isometric", "矢量圖": "vector art, flat design, clean lines, graphic illustration",
-    # 幻想與特定風格
-    "蒸汽龐克": "steampunk, victorian, gears, clockwork, intricate details", "黑暗奇幻": "dark fantasy, gothic, grim, lovecraftian horror, moody lighting",
-    "水彩畫": "watercolor painting, soft wash, blended colors, delicate", "剪紙藝術": "paper cut-out, layered paper, papercraft, flat shapes",
-    "奇幻藝術": "fantasy art, epic, detailed, magical, lord of the rings", "漫畫書": "comic book art, halftone dots, bold outlines, graphic novel style",
-    "線條藝術": "line art, monochrome, minimalist, clean lines", "霓虹龐克": "neon punk, fluorescent, glowing, psychedelic, vibrant",
-    "黑白線條藝術": "black and white line art, minimalist, clean vector, coloring book style",
-}
-
-def rerun_app():
-    if hasattr(st, 'rerun'): st.rerun()
+
+# 歷史與收藏分頁
+HISTORY_PAGE_SIZE = 5
+FAVORITES_PAGE_SIZE = 9
+
+def rerun_app(scope: str = "app"):
+    if hasattr(st, 'rerun'):
+        # 片段隨整頁一起執行時不允許片段範圍的重跑，此時退回整頁重跑
+        try: st.rerun(scope=scope)
+        except StreamlitAPIException: st.rerun()
     elif hasattr(st, 'experimental_rerun'): st.experimental_rerun()
     else: st.stop()
 
 st.set_page_config(page_title="FLUX AI (終極模型版)", page_icon="🏆", layout="wide")
-
-# **FIX**: Add the latest FLUX models to the hardcoded list
-API_PROVIDERS = {
-    "Pollinations.ai": {
-        "name": "Pollinations.ai Studio", 
-        "base_url_default": "https://image.pollinations.ai", 
-        "icon": "🌸",
-        "hardcoded_models": {
-            "flux-1.1-pro": {"name": "Flux 1.1 Pro", "icon": "🏆"},
-            "flux.1-kontext-pro": {"name": "Flux.1 Kontext Pro", "icon": "🧠"},
-            "flux.1-kontext-max": {"name": "Flux.1 Kontext Max", "icon": "👑"},
-            "flux-dev": {"name": "Flux Dev", "icon": "🛠️"},
-            "flux-schnell": {"name": "Flux Schnell", "icon": "⚡"}
-        }
-    },
-    "NavyAI": {"name": "NavyAI", "base_url_default": "https://api.navy/v1", "icon": "⚓"},
-    "OpenAI Compatible": {"name": "OpenAI 兼容 API", "base_url_default": "https://api.openai.com/v1", "icon": "🤖"},
-}
-
-BASE_FLUX_MODELS = {"flux.1-schnell": {"name": "FLUX.1 Schnell", "icon": "⚡", "priority": 1}}
+rerun_started_at = time.perf_counter()
+metrics = get_metrics()
+
+def timed_fragment(name: str, **fragment_kwargs):
+    """st.fragment 並記錄每次執行耗時 (render.<name>)；片段單獨重跑時，這就是一次互動的重跑耗時。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(f"render.{name}"): return func(*args, **kwargs)
+        return st.fragment(wrapper, **fragment_kwargs)
+    return decorator
 
 # --- 核心函數 ---
 def init_session_state():
     if 'api_profiles' not in st.session_state:
         try: base_profiles = st.secrets.get("api_profiles", {})
         except StreamlitSecretNotFoundError: base_profiles = {}
-        st.session_state.api_profiles = base_profiles.copy() if base_profiles else {"預設 Pollinations": {'provider': 'Pollinations.ai', 'api_key': '', 'base_url': 'https://image.pollinations.ai', 'validated': True, 'pollinations_auth_mode': '免費', 'pollinations_token': '', 'pollinations_referrer': ''}}
+        st.session_state.api_profiles = base_profiles.copy() if base_profiles else {name: dict(cfg) for name, cfg in DEFAULT_API_PROFILES.items()}
     if 'active_profile_name' not in st.session_state or st.session_state.active_profile_name not in st.session_state.api_profiles:
         st.session_state.active_profile_name = list(st.session_state.api_profiles.keys())[0] if st.session_state.api_profiles else ""
-    defaults = {'generation_history': [], 'favorite_images': [], 'discovered_models': {}}
+    defaults = {'generation_history': [], 'favorite_images': [], 'discovered_models': {}, 'use_result_cache': False, 'active_jobs': [], 'last_batch': None, 'active_sweep': None, 'queue_session_id': uuid.uuid4().hex}
     for key, value in defaults.items():
         if key not in st.session_state: st.session_state[key] = value
 
 def get_active_config(): return st.session_state.api_profiles.get(st.session_state.active_profile_name, {})
 
-def auto_discover_models(client, provider, base_url) -> Dict[str, Dict]:
-    discovered = {}
+def auto_discover_models(provider, base_url, api_key='') -> Dict[str, Dict]:
     try:
-        if provider == "Pollinations.ai":
-            response = requests.get(f"{base_url}/models", timeout=10)
-            if response.ok:
-                models = response.json()
-                for model_name in models: discovered[model_name] = {"name": model_name.replace('-', ' ').title(), "icon": "🌸"}
-            else: st.warning(f"無法從 Pollinations 獲取模型列表: HTTP {response.status_code}")
-        elif client:
-            models = client.models.list().data
-            for model in models:
-                if 'flux' in model.id.lower() or 'kontext' in model.id.lower():
-                    icon = "⚡" if 'flux' in model.id.lower() else "🧠"
-                    discovered[model.id] = {"name": model.id.replace('-', ' ').replace('_', ' ').title(), "icon": icon}
+        with metrics.timer("models.discover"): return models_from_ids(provider, fetch_model_ids(provider, base_url, api_key))
+    except RuntimeError as e: st.warning(str(e))
     except Exception as e: st.error(f"發現模型失敗: {e}")
-    return discovered
+    return {}
+
+def cached_discovered_models(cfg: Dict) -> Dict[str, Dict]:
+    # 切換存檔時直接沿用其他會話已發現的模型，不發出請求
+    model_ids = get_model_cache().get(credential_key(cfg.get('provider'), cfg.get('base_url', ''), cfg.get('api_key', '')))
+    return models_from_ids(cfg.get('provider'), model_ids) if model_ids else {}
 
 def merge_models() -> Dict[str, Dict]:
     provider = get_active_config().get('provider')
@@ -113,78 +75,137 @@ def merge_models() -> Dict[str, Dict]:
         return {**hardcoded, **discovered}
     else: return {**BASE_FLUX_MODELS, **st.session_state.get('discovered_models', {})}
 
-def validate_api_key(api_key: str, base_url: str, provider: str) -> Tuple[bool, str]:
-    if provider == "Pollinations.ai": return True, "Pollinations.ai 無需驗證"
-    try: OpenAI(api_key=api_key, base_url=base_url).models.list(); return True, "API 密鑰驗證成功"
-    except Exception as e: return False, f"API 驗證失敗: {e}"
-
-def generate_images_with_retry(client, **params) -> Tuple[bool, any]:
-    provider = get_active_config().get('provider')
-    n_images = params.get("n", 1)
-
-    if provider == "Pollinations.ai":
-        generated_images = []
-        for i in range(n_images):
-            try:
-                current_params = params.copy()
-                current_params["seed"] = random.randint(0, 1000000)
-                prompt = current_params.get("prompt", "")
-                if (neg_prompt := current_params.get("negative_prompt")): prompt += f" --no {neg_prompt}"
-                width, height = str(current_params.get("size", "1024x1024")).split('x')
-                api_params = {k: v for k, v in {"model": current_params.get("model"), "width": width, "height": height, "seed": current_params.get("seed"), "nologo": current_params.get("nologo"), "private": current_params.get("private"), "enhance": current_params.get("enhance"), "safe": current_params.get("safe")}.items() if v}
-                cfg = get_active_config()
-                headers = {}
-                auth_mode = cfg.get('pollinations_auth_mode', '免費')
-                if auth_mode == '令牌' and cfg.get('pollinations_token'): headers['Authorization'] = f"Bearer {cfg['pollinations_token']}"
-                elif auth_mode == '域名' and cfg.get('pollinations_referrer'): headers['Referer'] = cfg['pollinations_referrer']
-                response = requests.get(f"{cfg['base_url']}/prompt/{quote(prompt)}?{urlencode(api_params)}", headers=headers, timeout=120)
-                if response.ok:
-                    b64_json = base64.b64encode(response.content).decode()
-                    image_obj = type('Image', (object,), {'b64_json': b64_json})
-                    generated_images.append(image_obj)
-                else: st.warning(f"第 {i+1} 張圖片生成失敗: HTTP {response.status_code}")
-            except Exception as e:
-                st.warning(f"第 {i+1} 張圖片生成時出錯: {e}")
-                continue
-        if generated_images:
-            response_obj = type('Response', (object,), {'data': generated_images})
-            return True, response_obj
-        else: return False, "所有圖片生成均失敗。"
-    else: 
-        try:
-            sdk_params = {"model": params.get("model"), "prompt": params.get("prompt"), "negative_prompt": params.get("negative_prompt"), "size": str(params.get("size")), "n": n_images, "response_format": "b64_json"}
-            sdk_params = {k: v for k, v in sdk_params.items() if v is not None and v != ""}
-            return True, client.images.generate(**sdk_params)
-        except Exception as e: return False, str(e)
-    return False, "未知錯誤。"
-
 def add_to_history(prompt: str, negative_prompt: str, model: str, images: List[str], metadata: Dict):
     history = st.session_state.generation_history
     history.insert(0, {"id": str(uuid.uuid4()), "timestamp": datetime.datetime.now(), "prompt": prompt, "negative_prompt": negative_prompt, "model": model, "images": images, "metadata": metadata})
     st.session_state.generation_history = history[:MAX_HISTORY_ITEMS]
 
-def display_image_with_actions(b64_json: str, image_id: str, history_item: Dict):
+def commit_batch(entry: Dict, img_refs: List[str], times: List, message: str, errors: Optional[List] = None):
+    add_to_history(entry['prompt'], entry['negative_prompt'], entry['model'], img_refs, entry['metadata'])
+    st.session_state.last_batch = {"history_id": st.session_state.generation_history[0]['id'], "times": times, "message": message, "errors": errors or []}
+
+def finish_job(entry: Dict, job):
+    st.session_state.active_jobs = [e for e in st.session_state.active_jobs if e['job_id'] != entry['job_id']]
+    img_refs = job.image_refs()
+    if img_refs:
+        if entry.get('cache_key') and len(img_refs) == job.n: get_result_cache().put(entry['cache_key'], img_refs)
+        times = [result[2] for result in job.results if result and result[0]]
+        # 部分失敗時保留每張的錯誤；任務完成後進度面板即被整頁重跑取代，只能在此顯示
+        errors = [(i, result[1]) for i, result in enumerate(job.results) if result and not result[0]]
+        commit_batch(entry, img_refs, times, f"✨ 成功生成 {len(img_refs)}/{job.n} 張圖像！ (總耗時 {job.finished_at - job.submitted_at:.1f} 秒)", errors)
+    else:
+        errors = [result[1] for result in job.results if result and not result[0]]
+        st.session_state.last_batch = {"error": f"❌ 生成失敗: {errors[0] if errors else '所有圖片生成均失敗。'}"}
+
+def show_thumbnail(image_ref: str):
+    # 輪詢片段中的預覽：圖像可能已被淘汰，或供應商返回的內容無法解碼；不能讓片段每次輪詢都報錯
+    try: thumb = get_image_store().get_thumbnail(image_ref)
+    except Exception as e: st.error(f"圖像顯示錯誤: {e}"); return
+    if thumb is None: st.info("🗑️ 圖像已從存儲中清除")
+    else: st.image(thumb, use_container_width=True)
+
+def show_job_progress(entry: Dict, job):
+    queue = get_generation_queue()
+    with st.container(border=True):
+        st.markdown(f"**🎨 {entry['prompt'][:50]}**")
+        position = queue.position(job)
+        if job.status == "queued": st.info(f"⏳ 排隊中，前面還有 {position} 個請求")
+        else:
+            waiting = f" | 其餘請求排隊中，前面還有 {position} 個" if position is not None else ""
+            st.progress(job.completed / job.n, text=f"🎨 已完成 {job.completed}/{job.n} 張圖像{waiting}")
+        if len(job.sessions) > 1: st.caption(f"🤝 已與其他 {len(job.sessions) - 1} 個相同請求合併，共用同一次生成")
+        cols = st.columns(min(job.n, 2))
+        for i, result in enumerate(job.results):
+            with cols[i % 2]:
+                if result is None: st.info("⏳ 生成中..." if job.status == "running" else "⏳ 等待中...")
+                elif result[0]:
+                    show_thumbnail(result[1])
+                    st.caption(f"✅ 第 {i+1} 張 | {result[2]:.1f} 秒")
+                else: st.warning(f"❌ 第 {i+1} 張失敗 ({result[2]:.1f} 秒): {result[1]}")
+        if st.button("✖️ 取消", key=f"cancel_{job.id}", help="撤回尚未發出的請求"):
+            queue.cancel(job.id, st.session_state.queue_session_id)
+            st.session_state.active_jobs = [e for e in st.session_state.active_jobs if e['job_id'] != job.id]
+            rerun_app("fragment")
+
+@timed_fragment("jobs", run_every=QUEUE_POLL_INTERVAL)
+def show_active_jobs():
+    # 只有此片段按間隔重跑輪詢佇列；任務完成後才觸發整頁重跑以更新歷史
+    queue, finished = get_generation_queue(), False
+    for entry in list(st.session_state.active_jobs):
+        job = queue.get(entry['job_id'])
+        if job is None:
+            st.session_state.active_jobs = [e for e in st.session_state.active_jobs if e['job_id'] != entry['job_id']]
+            st.warning(f"⌛ 任務「{entry['prompt'][:30]}」已過期")
+        elif job.finished: finish_job(entry, job); finished = True
+        else: show_job_progress(entry, job)
+    if finished:
+        gc.collect()
+        rerun_app()
+
+@timed_fragment("last_batch")
+def show_last_batch():
+    last = st.session_state.last_batch
+    if last.get('error'): st.error(last['error']); return
+    history_item = next((item for item in st.session_state.generation_history if item['id'] == last['history_id']), None)
+    if history_item is None: return
+    st.success(last['message'])
+    for i, error in last.get('errors', []): st.warning(f"第 {i+1} 張圖片生成失敗: {error}")
+    cols = st.columns(min(len(history_item['images']), 2))
+    for i, image_ref in enumerate(history_item['images']):
+        with cols[i % 2]:
+            # 與歷史頁相同，先顯示縮圖，按「🔍 原圖」才讀取原圖；否則每次整頁重跑都會重新發送整批原圖
+            display_image_with_actions(image_ref, f"{history_item['id']}_{i}", history_item)
+            if i < len(last['times']) and last['times'][i] is not None: st.caption(f"✅ 第 {i+1} 張 | {last['times'][i]:.1f} 秒")
+
+def paginate(items: List, page_size: int, key: str) -> List:
+    total_pages = max(1, -(-len(items) // page_size))
+    if total_pages == 1: return items
+    if st.session_state.get(key, 1) > total_pages: st.session_state[key] = total_pages
+    page = st.number_input(f"頁碼 (共 {total_pages} 頁)", min_value=1, max_value=total_pages, step=1, key=key)
+    return items[(page - 1) * page_size:page * page_size]
+
+def display_image_with_actions(image_ref: str, image_id: str, history_item: Dict, full_size: bool = False):
+    with metrics.timer("render.image"): _display_image_with_actions(image_ref, image_id, history_item, full_size)
+
+def _display_image_with_actions(image_ref: str, image_id: str, history_item: Dict, full_size: bool):
     try:
-        img_data = base64.b64decode(b64_json)
-        st.image(Image.open(BytesIO(img_data)), use_container_width=True)
+        image_store = get_image_store()
+        full_views = st.session_state.setdefault('full_size_views', set())
+        show_full = full_size or image_id in full_views
+        # 預設只發送縮圖；原圖僅在查看原圖或下載時才讀取
+        img_data = image_store.get(image_ref) if show_full else None
+        preview = img_data if show_full else image_store.get_thumbnail(image_ref)
+        if preview is None: st.info("🗑️ 圖像已從存儲中清除")
+        else: st.image(preview, use_container_width=True)
         col1, col2, col3 = st.columns(3)
-        with col1: st.download_button("📥 下載", img_data, f"flux_{image_id}.png", "image/png", key=f"dl_{image_id}", use_container_width=True)
+        with col1:
+            if img_data is not None: st.download_button("📥 下載", img_data, f"flux_{image_id}.png", "image/png", key=f"dl_{image_id}", use_container_width=True)
+            elif preview is not None and st.button("🔍 原圖", key=f"full_{image_id}", use_container_width=True, help="查看原圖並下載"):
+                full_views.add(image_id)
+                rerun_app("fragment")
         with col2:
             is_fav = any(fav['id'] == image_id for fav in st.session_state.favorite_images)
             if st.button("⭐" if is_fav else "☆", key=f"fav_{image_id}", use_container_width=True, help="收藏/取消收藏"):
                 if is_fav: st.session_state.favorite_images = [f for f in st.session_state.favorite_images if f['id'] != image_id]
-                else: st.session_state.favorite_images.append({"id": image_id, "image_b64": b64_json, "timestamp": datetime.datetime.now(), "history_item": history_item})
+                else:
+                    # 收藏只保存圖像引用及提示詞等元數據，不複製整個歷史記錄的圖像列表
+                    item_meta = {k: v for k, v in (history_item or {}).items() if k != 'images'}
+                    st.session_state.favorite_images.append({"id": image_id, "image_ref": image_ref, "timestamp": datetime.datetime.now(), "history_item": item_meta})
+                    st.session_state.favorite_images = st.session_state.favorite_images[-MAX_FAVORITE_ITEMS:]
                 rerun_app()
         with col3:
             if st.button("🎨 變體", key=f"vary_{image_id}", use_container_width=True, help="使用此提示生成變體"):
                 st.session_state.update({'vary_prompt': history_item['prompt'], 'vary_negative_prompt': history_item.get('negative_prompt', ''), 'vary_model': history_item['model']})
                 rerun_app()
+        if image_id in full_views and st.button("🔽 收起原圖", key=f"collapse_{image_id}", use_container_width=True):
+            full_views.discard(image_id)
+            rerun_app("fragment")
     except Exception as e: st.error(f"圖像顯示錯誤: {e}")
 
 def init_api_client():
     cfg = get_active_config()
     if cfg and cfg.get('api_key') and cfg.get('provider') != "Pollinations.ai":
-        try: return OpenAI(api_key=cfg['api_key'], base_url=cfg['base_url'])
+        try: return get_client_registry().get(cfg['provider'], cfg['base_url'], cfg['api_key'])
         except Exception: return None
     return None
 
@@ -202,6 +223,8 @@ def load_profile_to_editor_state(profile_name):
     st.session_state.editor_auth_mode = config.get('pollinations_auth_mode', '免費')
     st.session_state.editor_referrer = config.get('pollinations_referrer', '')
     st.session_state.editor_token = config.get('pollinations_token', '')
+    st.session_state.editor_max_concurrency = get_max_concurrency(config)
+    st.session_state.editor_hedge_requests = bool(config.get('hedge_requests', False))
     st.session_state.profile_being_edited = profile_name
 
 def show_api_settings():
@@ -212,7 +235,7 @@ def show_api_settings():
     if st.session_state.get('active_profile_name') != active_profile_name or 'profile_being_edited' not in st.session_state or st.session_state.profile_being_edited != active_profile_name:
         st.session_state.active_profile_name = active_profile_name
         load_profile_to_editor_state(active_profile_name)
-        st.session_state.discovered_models = {}
+        st.session_state.discovered_models = cached_discovered_models(get_active_config())
         rerun_app()
 
     col1, col2 = st.columns(2)
@@ -239,13 +262,15 @@ def show_api_settings():
                 st.radio("認證模式", ["免費", "域名", "令牌"], key='editor_auth_mode', horizontal=True)
                 st.text_input("應用域名 (Referrer)", key='editor_referrer', disabled=(st.session_state.editor_auth_mode != '域名'))
                 st.text_input("API 令牌 (Token)", key='editor_token', type="password", disabled=(st.session_state.editor_auth_mode != '令牌'))
+                st.slider("並行請求上限", 1, MAX_BATCH_SIZE, key='editor_max_concurrency', help="批量生成時同時發出的請求數")
             else: st.text_input("API 密鑰", key='editor_api_key', type="password")
+            st.checkbox("對沖請求", key='editor_hedge_requests', help="請求耗時超過近期 P90 時再發出一個相同請求，取先返回者；可降低長尾延遲，但會增加請求數")
 
             if st.button("💾 保存/更新存檔", type="primary"):
                 provider = st.session_state.editor_provider_selectbox
-                new_config = {'provider': provider, 'base_url': st.session_state.editor_base_url}
+                new_config = {'provider': provider, 'base_url': st.session_state.editor_base_url, 'hedge_requests': st.session_state.editor_hedge_requests}
                 if provider == "Pollinations.ai":
-                    new_config.update({'api_key': '', 'pollinations_auth_mode': st.session_state.editor_auth_mode, 'pollinations_referrer': st.session_state.editor_referrer, 'pollinations_token': st.session_state.editor_token})
+                    new_config.update({'api_key': '', 'pollinations_auth_mode': st.session_state.editor_auth_mode, 'pollinations_referrer': st.session_state.editor_referrer, 'pollinations_token': st.session_state.editor_token, 'max_concurrency': st.session_state.editor_max_concurrency})
                 else: new_config.update({'api_key': st.session_state.editor_api_key, 'pollinations_auth_mode': '免費', 'pollinations_referrer': '', 'pollinations_token': ''})
                 is_valid, msg = validate_api_key(new_config['api_key'], new_config['base_url'], new_config['provider'])
                 new_config['validated'] = is_valid
@@ -256,13 +281,28 @@ def show_api_settings():
                 st.success(f"存檔 '{new_name}' 已保存。")
                 time.sleep(1); rerun_app()
 
-init_session_state()
-client = init_api_client()
-cfg = get_active_config()
-api_configured = cfg and cfg.get('validated', False)
+def format_metric(value, unit: str) -> str:
+    if value is None: return "-"
+    return f"{value * 1000:.1f} ms" if unit == "seconds" else f"{value / 1024:.1f} KB"
 
-# --- 側邊欄 ---
-with st.sidebar:
+def show_diagnostics():
+    with st.expander("🩺 效能診斷"):
+        snapshot = metrics.snapshot()
+        if not snapshot: st.caption("尚無度量數據。")
+        else:
+            st.dataframe([{"指標": name, "次數": snap['count'], "P50": format_metric(snap['p50'], snap['unit']), "P90": format_metric(snap['p90'], snap['unit']),
+                           "P99": format_metric(snap['p99'], snap['unit']), "最大": format_metric(snap['max'], snap['unit'])} for name, snap in snapshot.items()],
+                         hide_index=True, use_container_width=True)
+        col1, col2 = st.columns(2)
+        col1.download_button("📥 JSON", metrics.to_json(), "flux_metrics.json", "application/json", use_container_width=True)
+        col2.download_button("📥 Prometheus", metrics.to_prometheus(), "flux_metrics.prom", "text/plain", use_container_width=True)
+        if METRICS_EXPORT_DIR: st.caption(f"每 {METRICS_EXPORT_INTERVAL} 秒導出至 `{METRICS_EXPORT_DIR}`")
+
+@timed_fragment("sidebar")
+def show_sidebar():
+    # 側邊欄獨立重跑；切換或保存存檔等影響全頁的操作才調用 rerun_app() 觸發整頁重跑
+    client, cfg = init_api_client(), get_active_config()
+    api_configured = cfg and cfg.get('validated', False)
     show_api_settings()
     st.markdown("---")
     if api_configured:
@@ -270,80 +310,241 @@ with st.sidebar:
         can_discover = (client is not None) or (cfg.get('provider') == "Pollinations.ai")
         if st.button("🔍 發現模型", use_container_width=True, disabled=not can_discover):
             with st.spinner("🔍 正在發現模型..."):
-                discovered = auto_discover_models(client, cfg['provider'], cfg['base_url'])
+                discovered = auto_discover_models(cfg['provider'], cfg['base_url'], cfg.get('api_key', ''))
                 st.session_state.discovered_models = discovered
                 st.success(f"發現 {len(discovered)} 個模型！") if discovered else st.warning("未發現任何模型。")
                 time.sleep(1); rerun_app()
+        if st.button("♻️ 重新整理模型快取", use_container_width=True, help="清除此存檔的模型列表與驗證快取"):
+            invalidate_model_caches(cfg['provider'], cfg['base_url'], cfg.get('api_key', ''))
+            get_client_registry().invalidate(cfg['provider'], cfg['base_url'], cfg.get('api_key', ''))
+            st.session_state.discovered_models = {}
+            rerun_app()
+        with st.expander("📊 請求調度器"):
+            stats = get_scheduler(st.session_state.active_profile_name, cfg.get('base_url', '')).stats()
+            circuit_icons = {"closed": "🟢 正常", "half-open": "🟡 試探中", "open": "🔴 熔斷"}
+            latency = " / ".join(f"{v:.1f}s" if v is not None else "-" for v in (stats['p50'], stats['p95']))
+            queue_stats = get_generation_queue().stats()
+            st.caption(f"生成佇列: 運行 {queue_stats['running']}/{queue_stats['max_concurrency']} | 排隊 {queue_stats['queued']} | 合併 {queue_stats['coalesced']}")
+            st.caption(f"熔斷器: {circuit_icons[stats['circuit']]}\n\n請求: {stats['requests']} | 成功: {stats['successes']} | 失敗: {stats['failures']}\n\n重試: {stats['retries']} | 429: {stats['rate_limited']} | 熔斷拒絕: {stats['circuit_rejections']}\n\n對沖: {stats['hedged']} (勝出 {stats['hedge_wins']}) | 浪費請求: {stats['wasted']}\n\n延遲 P50 / P95: {latency}")
     elif st.session_state.api_profiles: st.error(f"🔴 '{st.session_state.active_profile_name}' 未驗證")
     st.markdown("---")
-    st.info(f"⚡ **免費版優化**\n- 歷史: {MAX_HISTORY_ITEMS}\n- 收藏: {MAX_FAVORITE_ITEMS}")
+    result_cache = get_result_cache()
+    st.checkbox("🗃️ 啟用結果快取", key='use_result_cache', help="相同請求 (含固定種子) 直接返回已生成的圖像")
+    st.caption(f"快取命中: {result_cache.hits} | 未命中: {result_cache.misses}")
+    show_diagnostics()
+    stored_count, stored_bytes = get_image_store().usage()
+    st.info(f"⚡ **免費版優化**\n- 歷史: {MAX_HISTORY_ITEMS}\n- 收藏: {MAX_FAVORITE_ITEMS}\n- 圖像存儲: {stored_count} 張 / {stored_bytes / 1024 / 1024:.1f} MB (上限 {IMAGE_STORE_MAX_BYTES // 1024 // 1024} MB)")
+
+@timed_fragment("generate_form")
+def show_generate_form(all_models: Dict[str, Dict]):
+    # 調整參數只重跑表單；提交後整頁重跑以顯示任務進度
+    client, cfg = init_api_client(), get_active_config()
+    prompt_default = st.session_state.pop('vary_prompt', '')
+    neg_prompt_default = st.session_state.pop('vary_negative_prompt', '')
+    model_default_key = st.session_state.pop('vary_model', list(all_models.keys())[0])
+    model_default_index = list(all_models.keys()).index(model_default_key) if model_default_key in all_models else 0
+
+    sel_model = st.selectbox("模型:", list(all_models.keys()), index=model_default_index, format_func=lambda x: f"{all_models.get(x, {}).get('icon', '🤖')} {all_models.get(x, {}).get('name', x)}")
+    n_images = st.slider("生成數量", 1, MAX_BATCH_SIZE, 1)
+    selected_style = st.selectbox("🎨 風格預設:", list(STYLE_PRESETS.keys()))
+    prompt_val = st.text_area("✍️ 提示詞:", value=prompt_default, height=100, placeholder="一隻貓在日落下飛翔，電影感，高品質")
+    negative_prompt_val = st.text_area("🚫 負向提示詞:", value=neg_prompt_default, height=50, placeholder="模糊, 糟糕的解剖結構, 文字, 水印")
+    size_preset = st.selectbox("圖像尺寸", options=list(IMAGE_SIZES.keys()), format_func=lambda x: IMAGE_SIZES[x])
+    final_size_str = size_preset
+    if size_preset == "自定義...":
+        w, h = st.columns(2)
+        width = w.slider("寬度", 256, 2048, 1024, 64)
+        height = h.slider("高度", 256, 2048, 1024, 64)
+        final_size_str = f"{width}x{height}"
+
+    enhance, private, nologo, safe, seed = False, False, False, False, None
+    if cfg.get('provider') == "Pollinations.ai":
+        with st.expander("🌸 Pollinations.ai 進階選項"):
+            enhance, private, nologo, safe = st.checkbox("增強提示詞", True), st.checkbox("私密模式", True), st.checkbox("移除標誌", True), st.checkbox("安全模式", False)
+            if st.checkbox("固定種子", False, help="固定種子可重現結果，並讓結果快取生效；批量生成時依次使用 種子, 種子+1, ..."):
+                seed = int(st.number_input("種子", 0, MAX_SEED, 42, 1))
+
+    if st.button("🚀 生成圖像", type="primary", use_container_width=True, disabled=not prompt_val.strip()):
+        final_prompt = build_final_prompt(prompt_val, selected_style)
+        params = {"model": sel_model, "prompt": final_prompt, "negative_prompt": negative_prompt_val, "size": final_size_str, "n": n_images, "seed": seed, "enhance": enhance, "private": private, "nologo": nologo, "safe": safe}
+        result_cache = get_result_cache()
+        cache_key = result_cache.make_key(cfg, params) if st.session_state.use_result_cache and is_cacheable(cfg, params) else None
+        img_refs = result_cache.get(cache_key) if cache_key else None
+        entry = {"prompt": prompt_val, "negative_prompt": negative_prompt_val, "model": sel_model, "cache_key": cache_key,
+                 "metadata": {"size": final_size_str, "provider": cfg['provider'], "style": selected_style, "n": n_images, "seed": seed}}
+        if img_refs: commit_batch(entry, img_refs, [], f"⚡ 命中結果快取，直接返回 {len(img_refs)} 張圖像！")
+        else:
+            # 提交到跨會話佇列後立即返回；任務在背景執行，頁面重跑不會中斷生成
+            job = get_generation_queue().submit(st.session_state.queue_session_id, cfg, client, st.session_state.active_profile_name, params)
+            # 重複提交相同請求時佇列會返回同一任務，不重複追蹤
+            if all(e['job_id'] != job.id for e in st.session_state.active_jobs): st.session_state.active_jobs.append({**entry, "job_id": job.id})
+            st.session_state.last_batch = None
+        rerun_app()
 
-st.title("🏆 FLUX AI (終極模型版)")
+SWEEP_AXIS_LABELS = {"model": "模型", "size": "尺寸", "style": "風格", "seed": "種子"}
+
+def format_sweep_value(axis: str, value, all_models: Dict[str, Dict]) -> str:
+    if axis == "model": return all_models.get(value, {}).get('name', value)
+    if axis == "seed": return f"種子 {value}"
+    return value
+
+@timed_fragment("sweep_form")
+def show_sweep_form(all_models: Dict[str, Dict]):
+    client, cfg = init_api_client(), get_active_config()
+    prompt_val = st.text_area("✍️ 提示詞:", height=100, key='sweep_prompt', placeholder="一隻貓在日落下飛翔，電影感，高品質")
+    negative_prompt_val = st.text_area("🚫 負向提示詞:", height=50, key='sweep_negative_prompt', placeholder="模糊, 糟糕的解剖結構, 文字, 水印")
+    models = st.multiselect("模型", list(all_models.keys()), default=list(all_models.keys())[:1], key='sweep_models', format_func=lambda x: f"{all_models.get(x, {}).get('icon', '🤖')} {all_models.get(x, {}).get('name', x)}")
+    styles = st.multiselect("🎨 風格", list(STYLE_PRESETS.keys()), default=["無"], key='sweep_styles')
+    sizes = st.multiselect("圖像尺寸", [size for size in IMAGE_SIZES if size != "自定義..."], default=["1024x1024"], key='sweep_sizes', format_func=lambda x: f"{x} {IMAGE_SIZES[x]}")
+    is_pollinations = cfg.get('provider') == "Pollinations.ai"
+    seeds_text = st.text_input("種子", "1, 2, 3, 4", key='sweep_seeds', help="以逗號分隔，可用 1-8 表示範圍" + ("" if is_pollinations else "；OpenAI 兼容 API 不支持種子，每個種子代表同一組合的一張額外圖像"))
+    flags = {}
+    if is_pollinations:
+        with st.expander("🌸 Pollinations.ai 進階選項"):
+            flags = {"enhance": st.checkbox("增強提示詞", True, key='sweep_enhance'), "private": st.checkbox("私密模式", True, key='sweep_private'),
+                     "nologo": st.checkbox("移除標誌", True, key='sweep_nologo'), "safe": st.checkbox("安全模式", False, key='sweep_safe')}
+    try: seeds = parse_seeds(seeds_text)
+    except ValueError as e: st.error(f"❌ {e}"); seeds = []
+
+    cells = build_sweep_cells(seeds, styles, sizes, models)
+    if cells:
+        tasks = plan_sweep(cfg, prompt_val, negative_prompt_val, cells, **flags)
+        estimate = estimate_sweep(cfg, tasks, get_scheduler(st.session_state.active_profile_name, cfg.get('base_url', '')).latency_percentile(0.5))
+        duration = f"，預計約 {estimate['seconds']:.0f} 秒" if estimate['seconds'] is not None else ""
+        st.info(f"📐 {len(cells)} 格 = {len(models)} 模型 × {len(sizes)} 尺寸 × {len(styles)} 風格 × {len(seeds)} 種子\n\n"
+                f"🚚 {estimate['requests']} 個請求，每輪並行 {estimate['parallel']} 個，約 {estimate['round_trips']} 輪往返{duration} | 💰 預估費用 ${estimate['cost']:.2f}")
+    if len(cells) > SWEEP_MAX_CELLS: st.warning(f"⚠️ 單次掃描最多 {SWEEP_MAX_CELLS} 格，請減少組合。")
+    if st.button("🧪 開始掃描", type="primary", use_container_width=True, disabled=not prompt_val.strip() or not cells or len(cells) > SWEEP_MAX_CELLS):
+        queue = get_generation_queue()
+        if (previous := st.session_state.active_sweep):
+            for job_id in {cell['job_id'] for cell in previous['cells']}: queue.cancel(job_id, st.session_state.queue_session_id)
+        st.session_state.active_sweep = {"id": uuid.uuid4().hex[:8], "prompt": prompt_val, "negative_prompt": negative_prompt_val, "submitted_at": time.time(), "finished_at": None,
+                                         "axes": {"model": models, "size": sizes, "style": styles, "seed": seeds},
+                                         "cells": submit_sweep(queue, st.session_state.queue_session_id, cfg, client, st.session_state.active_profile_name, cells, tasks)}
+        rerun_app()
 
-# --- 主介面 ---
-tab1, tab2, tab3 = st.tabs(["🚀 生成圖像", f"📚 歷史 ({len(st.session_state.generation_history)})", f"⭐ 收藏 ({len(st.session_state.favorite_images)})"])
+def sweep_results(sweep: Dict) -> List:
+    # 已結束的掃描使用快照：佇列只保留完成的任務 QUEUE_JOB_RETENTION_SECONDS 秒
+    if sweep.get('results') is not None: return sweep['results']
+    queue = get_generation_queue()
+    jobs = {job_id: queue.get(job_id) for job_id in {cell['job_id'] for cell in sweep['cells']}}
+    return [jobs[cell['job_id']].results[cell['slot']] if jobs[cell['job_id']] else (False, "任務已過期", 0.0) for cell in sweep['cells']]
+
+def show_sweep_grid(sweep: Dict, results: List, all_models: Dict[str, Dict]):
+    # 由使用者選擇作為列的維度，其餘維度的組合作為行
+    varying = [axis for axis in SWEEP_AXES if len(sweep['axes'][axis]) > 1] or ["seed"]
+    column_axis = st.selectbox("對比網格的列", varying, index=varying.index(max(varying, key=lambda axis: len(sweep['axes'][axis]))), key=f"sweep_columns_{sweep['id']}", format_func=SWEEP_AXIS_LABELS.get)
+    column_values = sweep['axes'][column_axis]
+    rows: Dict[tuple, Dict] = {}
+    for k, cell in enumerate(sweep['cells']):
+        row_key = tuple(cell[axis] for axis in SWEEP_AXES if axis != column_axis)
+        rows.setdefault(row_key, {})[cell[column_axis]] = k
+    header = st.columns(len(column_values))
+    for col, value in zip(header, column_values): col.markdown(f"**{format_sweep_value(column_axis, value, all_models)}**")
+    for row_key, row in rows.items():
+        labels = [format_sweep_value(axis, value, all_models) for axis, value in zip([a for a in SWEEP_AXES if a != column_axis], row_key) if len(sweep['axes'][axis]) > 1]
+        if labels: st.caption(" | ".join(labels))
+        for col, value in zip(st.columns(len(column_values)), column_values):
+            k = row.get(value)
+            if k is None: continue
+            cell, result = sweep['cells'][k], results[k]
+            with col:
+                if result is None: st.info("⏳")
+                elif not result[0]: st.warning(f"❌ {result[1]}")
+                elif sweep['finished_at'] is None: show_thumbnail(result[1])
+                else:
+                    # 掃描結束後每格都可收藏、查看原圖或生成變體；縮圖與其他頁面共用同一份快取
+                    item = {"id": f"sweep_{sweep['id']}_{k}", "prompt": sweep['prompt'], "negative_prompt": sweep['negative_prompt'], "model": cell['model'], "timestamp": datetime.datetime.now(),
+                            "metadata": {"size": cell['size'], "style": cell['style'], "seed": cell['seed'], "sweep": sweep['id']}}
+                    display_image_with_actions(result[1], item['id'], item)
+
+@timed_fragment("sweep", run_every=QUEUE_POLL_INTERVAL)
+def show_sweep_progress(all_models: Dict[str, Dict]):
+    sweep = st.session_state.active_sweep
+    results = sweep_results(sweep)
+    done = sum(result is not None for result in results)
+    if done == len(results):
+        sweep['results'], sweep['finished_at'] = list(results), time.time()
+        metrics.observe("sweep.total", sweep['finished_at'] - sweep['submitted_at'])
+        rerun_app()
+    st.progress(done / len(results), text=f"🧪 掃描中：已完成 {done}/{len(results)} 格 ({time.time() - sweep['submitted_at']:.0f} 秒)")
+    if st.button("✖️ 取消掃描", key=f"cancel_sweep_{sweep['id']}"):
+        for job_id in {cell['job_id'] for cell in sweep['cells']}: get_generation_queue().cancel(job_id, st.session_state.queue_session_id)
+        st.session_state.active_sweep = None
+        rerun_app()
+    show_sweep_grid(sweep, results, all_models)
+
+@timed_fragment("sweep_results")
+def show_sweep_results(all_models: Dict[str, Dict]):
+    sweep = st.session_state.active_sweep
+    results = sweep_results(sweep)
+    succeeded = sum(bool(result and result[0]) for result in results)
+    col1, col2 = st.columns([4, 1])
+    col1.success(f"✨ 掃描完成：{succeeded}/{len(results)} 格成功 (總耗時 {sweep['finished_at'] - sweep['submitted_at']:.1f} 秒)")
+    if col2.button("🧹 清除", key=f"clear_sweep_{sweep['id']}", use_container_width=True):
+        st.session_state.active_sweep = None
+        rerun_app()
+    show_sweep_grid(sweep, results, all_models)
 
-with tab1:
-    if not api_configured: st.warning("⚠️ 請在側邊欄選擇一個已驗證的存檔，或新增一個。")
-    else:
-        all_models = merge_models()
-        if not all_models: st.warning("⚠️ 未發現任何模型。請點擊側邊欄的「發現模型」。")
-        else:
-            prompt_default = st.session_state.pop('vary_prompt', '')
-            neg_prompt_default = st.session_state.pop('vary_negative_prompt', '')
-            model_default_key = st.session_state.pop('vary_model', list(all_models.keys())[0])
-            model_default_index = list(all_models.keys()).index(model_default_key) if model_default_key in all_models else 0
-
-            sel_model = st.selectbox("模型:", list(all_models.keys()), index=model_default_index, format_func=lambda x: f"{all_models.get(x, {}).get('icon', '🤖')} {all_models.get(x, {}).get('name', x)}")
-            n_images = st.slider("生成數量", 1, MAX_BATCH_SIZE, 1)
-            selected_style = st.selectbox("🎨 風格預設:", list(STYLE_PRESETS.keys()))
-            prompt_val = st.text_area("✍️ 提示詞:", value=prompt_default, height=100, placeholder="一隻貓在日落下飛翔，電影感，高品質")
-            negative_prompt_val = st.text_area("🚫 負向提示詞:", value=neg_prompt_default, height=50, placeholder="模糊, 糟糕的解剖結構, 文字, 水印")
-            size_preset = st.selectbox("圖像尺寸", options=list(IMAGE_SIZES.keys()), format_func=lambda x: IMAGE_SIZES[x])
-            final_size_str = size_preset
-            if size_preset == "自定義...":
-                w, h = st.columns(2)
-                width = w.slider("寬度", 256, 2048, 1024, 64)
-                height = h.slider("高度", 256, 2048, 1024, 64)
-                final_size_str = f"{width}x{height}"
-            
-            enhance, private, nologo, safe = False, False, False, False
-            if cfg.get('provider') == "Pollinations.ai":
-                with st.expander("🌸 Pollinations.ai 進階選項"):
-                    enhance, private, nologo, safe = st.checkbox("增強提示詞", True), st.checkbox("私密模式", True), st.checkbox("移除標誌", True), st.checkbox("安全模式", False)
-
-            if st.button("🚀 生成圖像", type="primary", use_container_width=True, disabled=not prompt_val.strip()):
-                final_prompt = f"{prompt_val}, {STYLE_PRESETS[selected_style]}" if selected_style != "無" and STYLE_PRESETS[selected_style] else prompt_val
-                with st.spinner(f"🎨 正在生成 {n_images} 張圖像..."):
-                    params = {"model": sel_model, "prompt": final_prompt, "negative_prompt": negative_prompt_val, "size": final_size_str, "n": n_images, "enhance": enhance, "private": private, "nologo": nologo, "safe": safe}
-                    success, result = generate_images_with_retry(client, **params)
-                    if success and result.data:
-                        img_b64s = [img.b64_json for img in result.data]
-                        add_to_history(prompt_val, negative_prompt_val, sel_model, img_b64s, {"size": final_size_str, "provider": cfg['provider'], "style": selected_style, "n": n_images})
-                        st.success(f"✨ 成功生成 {len(img_b64s)} 張圖像！")
-                        cols = st.columns(min(len(img_b64s), 2))
-                        for i, b64_json in enumerate(img_b64s):
-                            with cols[i % 2]: display_image_with_actions(b64_json, f"{st.session_state.generation_history[0]['id']}_{i}", st.session_state.generation_history[0])
-                        gc.collect()
-                    else: st.error(f"❌ 生成失敗: {result}")
-
-with tab2:
+@timed_fragment("history")
+def show_history():
+    # 翻頁與查看原圖只重跑此片段；收藏會改變分頁標題中的數量，仍需整頁重跑
     if not st.session_state.generation_history: st.info("📭 尚無生成歷史。")
     else:
-        for item in st.session_state.generation_history:
+        all_models = merge_models()
+        for item in paginate(st.session_state.generation_history, HISTORY_PAGE_SIZE, 'history_page'):
             with st.expander(f"🎨 {item['prompt'][:50]}... | {item['timestamp'].strftime('%m-%d %H:%M')}"):
-                model_name = merge_models().get(item['model'], {}).get('name', item['model'])
+                model_name = all_models.get(item['model'], {}).get('name', item['model'])
                 st.markdown(f"**提示詞**: {item['prompt']}\n\n**模型**: {model_name}")
                 if item.get('negative_prompt'): st.markdown(f"**負向提示詞**: {item['negative_prompt']}")
                 cols = st.columns(min(len(item['images']), 2))
-                for i, b64_json in enumerate(item['images']):
-                    with cols[i % 2]: display_image_with_actions(b64_json, f"hist_{item['id']}_{i}", item)
+                for i, image_ref in enumerate(item['images']):
+                    with cols[i % 2]: display_image_with_actions(image_ref, f"hist_{item['id']}_{i}", item)
 
-with tab3:
+@timed_fragment("favorites")
+def show_favorites():
     if not st.session_state.favorite_images: st.info("⭐ 尚無收藏的圖像。")
     else:
         cols = st.columns(3)
-        for i, fav in enumerate(sorted(st.session_state.favorite_images, key=lambda x: x['timestamp'], reverse=True)):
-            with cols[i % 3]: display_image_with_actions(fav['image_b64'], fav['id'], fav.get('history_item'))
+        favorites = sorted(st.session_state.favorite_images, key=lambda x: x['timestamp'], reverse=True)
+        for i, fav in enumerate(paginate(favorites, FAVORITES_PAGE_SIZE, 'favorites_page')):
+            with cols[i % 3]: display_image_with_actions(fav['image_ref'], fav['id'], fav.get('history_item'))
+
+init_session_state()
+
+# --- 側邊欄 ---
+with st.sidebar: show_sidebar()
+
+st.title("🏆 FLUX AI (終極模型版)")
+
+# --- 主介面 ---
+tab1, tab2, tab3 = st.tabs(["🚀 生成圖像", f"📚 歷史 ({len(st.session_state.generation_history)})", f"⭐ 收藏 ({len(st.session_state.favorite_images)})"])
+
+with tab1:
+    cfg = get_active_config()
+    if not (cfg and cfg.get('validated', False)): st.warning("⚠️ 請在側邊欄選擇一個已驗證的存檔，或新增一個。")
+    else:
+        all_models = merge_models()
+        if not all_models: st.warning("⚠️ 未發現任何模型。請點擊側邊欄的「發現模型」。")
+        else:
+            if st.radio("模式", ["🚀 單次生成", "🧪 參數掃描"], horizontal=True, key='generate_mode', label_visibility="collapsed") == "🚀 單次生成":
+                show_generate_form(all_models)
+                if st.session_state.active_jobs: show_active_jobs()
+                if st.session_state.last_batch: show_last_batch()
+            else:
+                show_sweep_form(all_models)
+                # 掃描期間仍需輪詢單次生成的任務，以便完成後寫入歷史
+                if st.session_state.active_jobs: show_active_jobs()
+                if (sweep := st.session_state.active_sweep):
+                    if sweep['finished_at'] is None: show_sweep_progress(all_models)
+                    else: show_sweep_results(all_models)
+
+with tab2: show_history()
+
+with tab3: show_favorites()
 
 st.markdown("""<div style="text-align: center; color: #888; margin-top: 2rem;"><small>🏆 終極模型版 | 部署在雲端平台 🏆</small></div>""", unsafe_allow_html=True)
+
+metrics.observe("render.rerun", time.perf_counter() - rerun_started_at)
+metrics.observe("session.state", deep_sizeof(st.session_state.to_dict()), unit="bytes")
+metrics.maybe_export(METRICS_EXPORT_DIR, METRICS_EXPORT_INTERVAL)
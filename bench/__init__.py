@@ -0,0 +1 @@
+"""效能基準測試工具：本地模擬圖像伺服器與基準測試驅動程式。"""
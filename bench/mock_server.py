@@ -0,0 +1,111 @@
+"""本地模擬圖像伺服器，同時實現 Pollinations (/prompt/{prompt}、/models) 與 OpenAI (/v1/images/generations、/v1/models) 路由。
+
+    python -m bench.mock_server --port 8765 --latency 2 --jitter 1 --error-rate 0.1
+
+延遲、錯誤率 (隨機返回 429 / 503 並帶 Retry-After) 與返回圖像尺寸均可配置，用於在不調用真實 API 的情況下測量效能。
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+MODEL_IDS = ["flux", "flux.1-schnell", "flux-dev", "turbo"]
+
+class MockSettings:
+    def __init__(self, latency: float = 1.0, jitter: float = 0.0, error_rate: float = 0.0, image_size: Optional[str] = None, retry_after: int = 1):
+        self.latency, self.jitter, self.error_rate, self.image_size, self.retry_after = latency, jitter, error_rate, image_size, retry_after
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._pngs: Dict[Tuple[int, int], bytes] = {}
+
+    def count(self):
+        with self._lock: self.requests += 1
+
+    def png(self, width: int, height: int) -> bytes:
+        if self.image_size: width, height = (int(v) for v in self.image_size.split("x"))
+        with self._lock:
+            if (width, height) not in self._pngs:
+                # 隨機雜訊不可壓縮，響應體大小接近真實照片級 PNG
+                buffer = BytesIO()
+                Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).save(buffer, "PNG", compress_level=1)
+                self._pngs[(width, height)] = buffer.getvalue()
+            return self._pngs[(width, height)]
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = MockSettings()
+
+    def log_message(self, *args): pass
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type); self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items(): self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self) -> bool:
+        """模擬生成耗時與錯誤；返回 False 表示已發送錯誤響應。"""
+        self.settings.count()
+        time.sleep(max(0.0, self.settings.latency + random.uniform(-self.settings.jitter, self.settings.jitter)))
+        if random.random() < self.settings.error_rate:
+            status = random.choice([429, 503])
+            self._send(status, json.dumps({"error": {"message": f"mock error {status}"}}).encode(), headers={"Retry-After": str(self.settings.retry_after)})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ("/models", "/v1/models"):
+            if url.path == "/models": body = MODEL_IDS
+            else: body = {"object": "list", "data": [{"id": m, "object": "model", "created": 0, "owned_by": "mock"} for m in MODEL_IDS]}
+            return self._send(200, json.dumps(body).encode())
+        if url.path.startswith("/prompt/"):
+            query = parse_qs(url.query)
+            width, height = int(query.get("width", ["1024"])[0]), int(query.get("height", ["1024"])[0])
+            if self._simulate(): self._send(200, self.settings.png(width, height), "image/png")
+            return
+        self._send(404, b'{"error": "not found"}')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlparse(self.path).path != "/v1/images/generations": return self._send(404, b'{"error": "not found"}')
+        params = json.loads(body or b"{}")
+        width, height = (int(v) for v in str(params.get("size", "1024x1024")).split("x"))
+        if not self._simulate(): return
+        b64_json = base64.b64encode(self.settings.png(width, height)).decode()
+        self._send(200, json.dumps({"created": int(time.time()), "data": [{"b64_json": b64_json} for _ in range(int(params.get("n", 1)))]}).encode())
+
+def start_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在背景執行緒啟動伺服器；port 為 0 時自動選擇空閒端口 (見 server.server_port)。"""
+    handler = type("BoundMockHandler", (MockHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.mock_server", description="本地模擬 Pollinations / OpenAI 圖像伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="每次生成的平均延遲 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延遲的隨機浮動範圍 (± 秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429 / 503 的機率")
+    parser.add_argument("--image-size", help="固定返回的圖像尺寸，例如 512x512 (預設按請求尺寸)")
+    args = parser.parse_args()
+    server = start_server(MockSettings(args.latency, args.jitter, args.error_rate, args.image_size), args.host, args.port)
+    print(f"🧪 模擬伺服器運行於 http://{args.host}:{server.server_port}  (Pollinations: /prompt/...，OpenAI: /v1)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt: server.shutdown()
+
+if __name__ == "__main__": main()
@@ -0,0 +1,228 @@
+"""效能基準測試：以本地模擬伺服器驅動生成路徑，用 Streamlit AppTest 測量歷史 / 收藏頁面的重跑耗時，並在全新進程中測量冷啟動耗時。
+
+    python -m bench.run --output bench.json
+    python -m bench.run --output after.json --compare bench.json
+
+結果為 JSON (延遲百分位、吞吐量、峰值 RSS、整頁與各片段的重跑耗時、冷啟動耗時)，並記錄當前 git 提交，方便在不同提交之間比較。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from io import BytesIO
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRAGMENTS = ("sidebar", "generate_form", "history", "favorites")
+
+# 在子進程中執行：導入 flux_core 並首次運行 app.py，輸出各階段耗時與已導入的重型依賴
+COLD_START_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import flux_core
+imported = time.perf_counter() - start
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=300)
+at.session_state["api_profiles"] = json.loads(sys.argv[2])
+start = time.perf_counter(); at.run(); first_run = time.perf_counter() - start
+print(json.dumps({"import": imported, "first_run": first_run, "heavy_modules": [m for m in ("openai", "PIL") if m in sys.modules]}))
+"""
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """以毫秒為單位返回 p50 / p90 / p99 / 平均值 / 最大值。"""
+    if not values: return {"p50": None, "p90": None, "p99": None, "mean": None, "max": None, "count": 0}
+    ms = lambda v: round(v * 1000, 1)
+    return {"p50": ms(percentile(values, 0.5)), "p90": ms(percentile(values, 0.9)), "p99": ms(percentile(values, 0.99)), "mean": ms(sum(values) / len(values)), "max": ms(max(values)), "count": len(values)}
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # macOS 以位元組計，Linux 以 KB 計
+
+def git_commit() -> Optional[str]:
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def log(message: str): print(message, file=sys.stderr, flush=True)
+
+def bench_generation(base_url: str, providers: List[str], batch_sizes: List[int], iterations: int, size: str) -> List[Dict]:
+    from flux_core import get_client_registry, get_scheduler, iter_generated_images
+    results = []
+    for provider in providers:
+        for n in batch_sizes:
+            # 每個案例使用獨立存檔名稱，確保調度器 (令牌桶、延遲統計) 從零開始
+            profile_name = f"bench-{provider}-{n}"
+            if provider == "pollinations":
+                cfg, client = {"provider": "Pollinations.ai", "base_url": base_url, "max_concurrency": n}, None
+            else:
+                cfg = {"provider": "OpenAI Compatible", "base_url": f"{base_url}/v1", "api_key": "bench"}
+                client = get_client_registry().get(cfg['provider'], cfg['base_url'], cfg['api_key'])
+            batch_times, first_image_times, image_times, images, failed = [], [], [], 0, 0
+            case_start = time.perf_counter()
+            for _ in range(iterations):
+                batch_start, first = time.perf_counter(), None
+                for _, ok, _, elapsed in iter_generated_images(cfg, client, profile_name, model="flux", prompt="benchmark", size=size, n=n):
+                    if first is None: first = time.perf_counter() - batch_start
+                    if ok: images += 1; image_times.append(elapsed)
+                    else: failed += 1
+                batch_times.append(time.perf_counter() - batch_start); first_image_times.append(first)
+            total = time.perf_counter() - case_start
+            stats = get_scheduler(profile_name, cfg['base_url']).stats()
+            results.append({"provider": provider, "batch_size": n, "iterations": iterations, "batch_latency_ms": summarize(batch_times), "first_image_ms": summarize(first_image_times),
+                            "image_latency_ms": summarize(image_times), "images": images, "failed": failed, "throughput_images_per_min": round(images / total * 60, 2),
+                            "scheduler": {k: v for k, v in stats.items() if k not in ("p50", "p95")}})
+            log(f"  生成 {provider:<12} n={n}: 批次 p50 {results[-1]['batch_latency_ms']['p50']} ms | {results[-1]['throughput_images_per_min']} 張/分鐘")
+    return results
+
+def _noise_png(width: int, height: int) -> bytes:
+    from PIL import Image
+    buffer = BytesIO()
+    Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+def bench_cold_start(base_url: str, repeats: int) -> Dict:
+    profiles = {"bench": {'provider': 'Pollinations.ai', 'api_key': '', 'base_url': base_url, 'validated': True, 'pollinations_auth_mode': '免費'}}
+    imports, first_runs, heavy_modules = [], [], set()
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", COLD_START_PROBE, os.path.join(ROOT, "app.py"), json.dumps(profiles)], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        imports.append(probe["import"]); first_runs.append(probe["first_run"]); heavy_modules.update(probe["heavy_modules"])
+    result = {"repeats": repeats, "import_flux_core_ms": summarize(imports), "first_run_ms": summarize(first_runs), "heavy_modules_loaded": sorted(heavy_modules)}
+    log(f"  冷啟動: 導入 flux_core p50 {result['import_flux_core_ms']['p50']} ms | 首次執行 p50 {result['first_run_ms']['p50']} ms | 已導入: {', '.join(result['heavy_modules_loaded']) or '無'}")
+    return result
+
+def bench_render(base_url: str, history_lengths: List[int], favorites: int, reruns: int, image_size: str) -> List[Dict]:
+    from streamlit.testing.v1 import AppTest
+    from flux_core import get_image_store, get_metrics
+    image_store, metrics = get_image_store(), get_metrics()
+    width, height = (int(v) for v in image_size.split("x"))
+    images_per_item = 4
+    refs = [image_store.put(_noise_png(width, height)) for _ in range(max(history_lengths, default=0) * images_per_item)]
+    profiles = {"bench": {'provider': 'Pollinations.ai', 'api_key': '', 'base_url': base_url, 'validated': True, 'pollinations_auth_mode': '免費'}}
+    results = []
+    for length in history_lengths:
+        now = datetime.datetime.now()
+        history = [{"id": str(uuid.uuid4()), "timestamp": now, "prompt": f"benchmark prompt {j}", "negative_prompt": "", "model": "flux", "images": refs[j * images_per_item:(j + 1) * images_per_item], "metadata": {}} for j in range(length)]
+        favs = [{"id": f"hist_{item['id']}_{i}", "image_ref": ref, "timestamp": now, "history_item": {k: v for k, v in item.items() if k != 'images'}}
+                for item in history for i, ref in enumerate(item['images'])][:favorites]
+        image_store.clear_thumbnails(); metrics.reset()
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=300)
+        at.session_state["api_profiles"] = profiles
+        at.session_state["generation_history"], at.session_state["favorite_images"] = history, favs
+        start = time.perf_counter(); at.run(); cold = time.perf_counter() - start
+        warm = []
+        for _ in range(reruns):
+            start = time.perf_counter(); at.run(); warm.append(time.perf_counter() - start)
+        # AppTest 每次都執行整個腳本，各片段的耗時即為瀏覽器中只重跑該片段時的互動耗時
+        snapshot = metrics.snapshot()
+        fragments = {name: round(snapshot[f"render.{name}"]["p50"] * 1000, 1) for name in FRAGMENTS if f"render.{name}" in snapshot}
+        click = None
+        fav_buttons = [b for b in at.button if b.key and b.key.startswith("fav_hist_")]
+        if fav_buttons:
+            start = time.perf_counter(); fav_buttons[0].click().run(); click = time.perf_counter() - start
+        results.append({"history_items": length, "favorites": len(favs), "cold_rerun_ms": round(cold * 1000, 1), "warm_rerun_ms": summarize(warm), "fragment_rerun_p50_ms": fragments,
+                        "favorite_click_ms": round(click * 1000, 1) if click is not None else None, "exceptions": [str(e.value) for e in at.exception]})
+        log(f"  渲染 歷史={length:<3} 收藏={len(favs):<3}: 首次 {results[-1]['cold_rerun_ms']} ms | 重跑 p50 {results[-1]['warm_rerun_ms']['p50']} ms")
+    return results
+
+def flatten(report: Dict) -> Dict[str, float]:
+    metrics = {}
+    for case in report.get("generation", []):
+        prefix = f"generation.{case['provider']}.n{case['batch_size']}"
+        metrics[f"{prefix}.batch_p50_ms"] = case["batch_latency_ms"]["p50"]
+        metrics[f"{prefix}.batch_p99_ms"] = case["batch_latency_ms"]["p99"]
+        metrics[f"{prefix}.first_image_p50_ms"] = case["first_image_ms"]["p50"]
+        metrics[f"{prefix}.images_per_min"] = case["throughput_images_per_min"]
+    for case in report.get("render", []):
+        prefix = f"render.h{case['history_items']}.f{case['favorites']}"
+        metrics[f"{prefix}.cold_ms"] = case["cold_rerun_ms"]
+        metrics[f"{prefix}.warm_p50_ms"] = case["warm_rerun_ms"]["p50"]
+        metrics[f"{prefix}.favorite_click_ms"] = case["favorite_click_ms"]
+        for name, value in case.get("fragment_rerun_p50_ms", {}).items(): metrics[f"{prefix}.fragment.{name}_p50_ms"] = value
+    if (cold := report.get("cold_start")):
+        metrics["cold_start.import_flux_core_p50_ms"] = cold["import_flux_core_ms"]["p50"]
+        metrics["cold_start.first_run_p50_ms"] = cold["first_run_ms"]["p50"]
+    metrics["peak_rss_mb"] = report.get("peak_rss_mb")
+    return metrics
+
+def print_comparison(baseline: Dict, current: Dict):
+    old, new = flatten(baseline), flatten(current)
+    log(f"\n📊 與 {baseline.get('meta', {}).get('commit') or '基準'} 比較 (當前 {current['meta'].get('commit') or '-'})")
+    for key in sorted(set(old) | set(new)):
+        before, after = old.get(key), new.get(key)
+        delta = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "-"
+        log(f"  {key:<48} {str(before):>12} → {str(after):>12}  {delta}")
+
+def parse_ints(value: str) -> List[int]: return [int(v) for v in value.split(",") if v.strip()]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description="FLUX AI 效能基準測試")
+    parser.add_argument("--output", help="JSON 結果輸出路徑 (預設輸出到標準輸出)")
+    parser.add_argument("--compare", help="與先前的 JSON 結果比較")
+    parser.add_argument("--latency", type=float, default=0.5, help="模擬伺服器的平均生成延遲 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="模擬延遲的浮動範圍 (± 秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模擬伺服器返回 429 / 503 的機率")
+    parser.add_argument("--size", default="1024x1024", help="生成請求的圖像尺寸")
+    parser.add_argument("--providers", default="pollinations,openai")
+    parser.add_argument("--batch-sizes", type=parse_ints, default=[1, 2, 4])
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--history-lengths", type=parse_ints, default=[0, 5, 15])
+    parser.add_argument("--favorites", type=int, default=9, help="渲染測試中預置的收藏數量")
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--render-image-size", default="1080x1920", help="渲染測試中歷史圖像的尺寸")
+    parser.add_argument("--cold-starts", type=int, default=3, help="冷啟動測量次數 (每次啟動一個新進程)")
+    parser.add_argument("--skip-generation", action="store_true")
+    parser.add_argument("--skip-render", action="store_true")
+    parser.add_argument("--skip-cold-start", action="store_true")
+    args = parser.parse_args(argv)
+
+    # 快取目錄必須在導入 flux_core 之前指向臨時目錄，避免污染本地 .flux_cache
+    workdir = tempfile.mkdtemp(prefix="flux-bench-")
+    os.environ["FLUX_IMAGE_STORE_DIR"] = os.path.join(workdir, "images")
+    os.environ["FLUX_RESULT_CACHE_DIR"] = os.path.join(workdir, "results")
+    os.environ.setdefault("FLUX_IMAGE_STORE_MAX_MB", "4096")
+    sys.path.insert(0, ROOT)
+    from bench.mock_server import MockSettings, start_server
+
+    server = start_server(MockSettings(args.latency, args.jitter, args.error_rate))
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    report = {"meta": {"commit": git_commit(), "timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(), "platform": platform.platform(),
+                       "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")}}}
+    try:
+        if not args.skip_generation:
+            log("🚀 生成路徑")
+            report["generation"] = bench_generation(base_url, [p.strip() for p in args.providers.split(",") if p.strip()], args.batch_sizes, args.iterations, args.size)
+        if not args.skip_cold_start:
+            log("🧊 冷啟動")
+            report["cold_start"] = bench_cold_start(base_url, args.cold_starts)
+        if not args.skip_render:
+            log("🖼️ 渲染路徑")
+            report["render"] = bench_render(base_url, args.history_lengths, args.favorites, args.reruns, args.render_image_size)
+        report["mock_requests"] = server.RequestHandlerClass.settings.requests
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(output + "\n")
+        log(f"💾 結果已寫入 {args.output}")
+    else: print(output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f: print_comparison(json.load(f), report)
+    return 0
+
+if __name__ == "__main__": sys.exit(main())
@@ -0,0 +1,11 @@
+"""FLUX AI 的核心邏輯 (不依賴 Streamlit)：配置、圖像存儲與快取、請求調度及供應商調用，以及跨會話生成佇列與參數掃描。"""
+from .config import API_PROVIDERS, BASE_FLUX_MODELS, DEFAULT_API_PROFILES, IMAGE_SIZES, MAX_BATCH_SIZE, MAX_SEED, STYLE_PRESETS
+from .providers import (ClientRegistry, build_final_prompt, credential_key, default_models, execute_generation_request, fetch_model_ids,
+                        generate_images_with_retry, get_client_registry, get_http_session, get_image_store, get_max_concurrency, get_model_cache,
+                        get_result_cache, get_scheduler, get_validation_cache, invalidate_model_caches, iter_generated_images, load_api_profiles,
+                        models_from_ids, plan_generation_requests, result_image_bytes, validate_api_key)
+from .jobqueue import GenerationJob, GenerationQueue, get_generation_queue
+from .metrics import MetricsRegistry, deep_sizeof, get_metrics
+from .scheduler import CircuitOpenError, ProviderHTTPError, ProviderScheduler
+from .storage import ImageStore, ResultCache, TTLCache, is_cacheable
+from .sweep import SWEEP_AXES, build_sweep_cells, estimate_sweep, parse_seeds, plan_sweep, submit_sweep
@@ -0,0 +1,146 @@
+"""無介面批量生成：讀取 JSONL / CSV 任務檔，以有界並行工作池生成圖像，並把 PNG 與結果清單寫入輸出目錄。
+
+    python -m flux_core.batch jobs.jsonl -o output/ --profile 我的Pollinations --workers 4
+
+每行一個任務，欄位與生成頁面相同：prompt (必填)、negative_prompt、style、size、model、n、seed、enhance、private、nologo、safe，
+可選 id。已在 manifest.jsonl 中標記為 ok 的任務會在重新執行時跳過，因此中斷後直接重跑同一命令即可續傳。
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set
+
+from .config import IMAGE_SIZES, MAX_BATCH_SIZE, MAX_SEED, STYLE_PRESETS
+from .fileio import write_atomic
+from .providers import build_final_prompt, default_models, get_client_registry, iter_generated_images, load_api_profiles
+
+MANIFEST_NAME = "manifest.jsonl"
+DEFAULT_WORKERS = 4
+POLLINATIONS_FLAG_DEFAULTS = {"enhance": True, "private": True, "nologo": True, "safe": False}  # 與生成頁面的預設值一致
+
+def _parse_bool(value, default: bool) -> bool:
+    if value is None or value == "": return default
+    if isinstance(value, bool): return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "on")
+
+def normalize_job(raw: Dict, line_no: int) -> Dict:
+    prompt = str(raw.get("prompt") or "").strip()
+    if not prompt: raise ValueError(f"第 {line_no} 行: 缺少 prompt")
+    style = raw.get("style") or "無"
+    if style not in STYLE_PRESETS: raise ValueError(f"第 {line_no} 行: 未知風格 '{style}'")
+    size = str(raw.get("size") or "1024x1024")
+    if size not in IMAGE_SIZES and not re.fullmatch(r"\d+x\d+", size): raise ValueError(f"第 {line_no} 行: 無效尺寸 '{size}'")
+    try:
+        n = int(raw.get("n") or 1)
+        seed = int(raw["seed"]) % (MAX_SEED + 1) if raw.get("seed") not in (None, "") else None
+    except (TypeError, ValueError): raise ValueError(f"第 {line_no} 行: n 或 seed 不是整數")
+    if not 1 <= n <= MAX_BATCH_SIZE: raise ValueError(f"第 {line_no} 行: n 必須介於 1 與 {MAX_BATCH_SIZE} 之間")
+    job = {"prompt": prompt, "negative_prompt": str(raw.get("negative_prompt") or ""), "style": style, "size": size, "model": raw.get("model") or None, "n": n, "seed": seed,
+           **{flag: _parse_bool(raw.get(flag), default) for flag, default in POLLINATIONS_FLAG_DEFAULTS.items()}}
+    # 未指定 id 時以任務內容生成穩定 id，任務檔重新排序後仍可續傳
+    job["id"] = str(raw.get("id") or hashlib.sha256(json.dumps(job, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16])
+    return job
+
+def read_jobs(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"): rows = [(i + 2, row) for i, row in enumerate(csv.DictReader(f))]
+        else: rows = [(i + 1, json.loads(line)) for i, line in enumerate(f) if line.strip() and not line.lstrip().startswith("#")]
+    jobs, seen = [], set()
+    for line_no, row in rows:
+        job = normalize_job(row, line_no)
+        if job["id"] in seen:
+            print(f"⚠️ 第 {line_no} 行與先前的任務重複 (id={job['id']})，已略過", file=sys.stderr)
+            continue
+        seen.add(job["id"]); jobs.append(job)
+    return jobs
+
+def load_completed(manifest_path: str) -> Set[str]:
+    completed = set()
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            for line in f:
+                try: record = json.loads(line)
+                except ValueError: continue  # 崩潰時可能留下不完整的最後一行
+                if record.get("status") == "ok": completed.add(record["id"])
+    except FileNotFoundError: pass
+    return completed
+
+class ManifestWriter:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush(); os.fsync(self._file.fileno())
+
+    def close(self): self._file.close()
+
+def run_job(job: Dict, cfg: Dict, client, profile_name: str, output_dir: str) -> Dict:
+    model = job["model"] or next(iter(default_models(cfg.get('provider'))))
+    params = {"model": model, "prompt": build_final_prompt(job["prompt"], job["style"]), "negative_prompt": job["negative_prompt"], "size": job["size"], "n": job["n"], "seed": job["seed"],
+              **({flag: job[flag] for flag in POLLINATIONS_FLAG_DEFAULTS} if cfg.get('provider') == "Pollinations.ai" else {})}
+    start, images, errors = time.time(), {}, []
+    try:
+        for i, ok, payload, _ in iter_generated_images(cfg, client, profile_name, **params):
+            if ok:
+                images[i] = f"{job['id']}_{i}.png"
+                write_atomic(os.path.join(output_dir, images[i]), payload)
+            else: errors.append(f"第 {i+1} 張: {payload}")
+    except Exception as e: errors.append(str(e))
+    status = "ok" if len(images) == job["n"] else ("partial" if images else "failed")
+    return {"id": job["id"], "status": status, "images": [images[i] for i in sorted(images)], "errors": errors, "elapsed": round(time.time() - start, 3),
+            "prompt": job["prompt"], "style": job["style"], "params": {k: v for k, v in params.items() if k != "prompt"}, "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m flux_core.batch", description="從 JSONL / CSV 任務檔批量生成圖像")
+    parser.add_argument("jobs", help="任務檔 (.jsonl 或 .csv)")
+    parser.add_argument("-o", "--output", required=True, help="輸出目錄，PNG 與 manifest.jsonl 將寫入此處")
+    parser.add_argument("--profile", help="secrets.toml 中的 API 存檔名稱 (預設為第一個)")
+    parser.add_argument("--secrets", help="secrets.toml 路徑 (預設 .streamlit/secrets.toml)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"同時處理的任務數 (預設 {DEFAULT_WORKERS})")
+    args = parser.parse_args(argv)
+
+    profiles = load_api_profiles(args.secrets)
+    profile_name = args.profile or next(iter(profiles))
+    if profile_name not in profiles: parser.error(f"找不到 API 存檔 '{profile_name}'，可用: {', '.join(profiles)}")
+    cfg = profiles[profile_name]
+    client = None
+    if cfg.get('provider') != "Pollinations.ai":
+        if not cfg.get('api_key'): parser.error(f"存檔 '{profile_name}' 缺少 api_key")
+        client = get_client_registry().get(cfg['provider'], cfg['base_url'], cfg['api_key'])
+
+    try: jobs = read_jobs(args.jobs)
+    except (OSError, ValueError) as e: parser.error(str(e))
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST_NAME)
+    completed = load_completed(manifest_path)
+    pending = [job for job in jobs if job["id"] not in completed]
+    print(f"📋 共 {len(jobs)} 個任務，已完成 {len(jobs) - len(pending)} 個，待處理 {len(pending)} 個 (存檔: {profile_name}，並行: {args.workers})", file=sys.stderr)
+
+    writer = ManifestWriter(manifest_path)
+    start, done, image_count, failed = time.time(), 0, 0, 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = [pool.submit(run_job, job, cfg, client, profile_name, args.output) for job in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                writer.write(record)
+                done += 1; image_count += len(record["images"]); failed += record["status"] != "ok"
+                rate = image_count / max(time.time() - start, 1e-9) * 60
+                print(f"[{done}/{len(pending)}] {record['id']} {record['status']} ({record['elapsed']:.1f}s) | {rate:.1f} 張/分鐘", file=sys.stderr)
+                for error in record["errors"]: print(f"    ⚠️ {error}", file=sys.stderr)
+    finally: writer.close()
+    elapsed = time.time() - start
+    print(f"✨ 完成 {done} 個任務，生成 {image_count} 張圖像，失敗 {failed} 個 | 耗時 {elapsed:.1f} 秒 | 吞吐量 {image_count / max(elapsed, 1e-9) * 60:.1f} 張/分鐘", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__": sys.exit(main())
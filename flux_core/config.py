@@ -0,0 +1,98 @@
+"""全局配置：供應商、模型、風格與尺寸預設，以及快取與調度器參數。"""
+import os
+
+MAX_BATCH_SIZE = 4
+DEFAULT_MAX_CONCURRENCY = 4  # Pollinations 批量生成的預設並行請求上限
+
+# 本地圖像存儲 (以內容哈希為鍵，所有會話共用)
+IMAGE_STORE_DIR = os.environ.get("FLUX_IMAGE_STORE_DIR", os.path.join(".flux_cache", "images"))
+IMAGE_STORE_MAX_BYTES = int(os.environ.get("FLUX_IMAGE_STORE_MAX_MB", "512")) * 1024 * 1024
+THUMBNAIL_MAX_SIDE = 384
+THUMBNAIL_CACHE_ITEMS = 256  # 記憶體中保留的縮圖數量
+
+# 生成結果快取 (記憶體 LRU + 磁碟，需在側邊欄啟用)
+RESULT_CACHE_DIR = os.environ.get("FLUX_RESULT_CACHE_DIR", os.path.join(".flux_cache", "results"))
+RESULT_CACHE_MEMORY_ITEMS = 128
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("FLUX_RESULT_CACHE_TTL", str(24 * 3600)))
+MAX_SEED = 1000000
+
+# 模型列表與密鑰驗證的跨會話快取
+MODEL_CACHE_TTL_SECONDS = int(os.environ.get("FLUX_MODEL_CACHE_TTL", "600"))
+VALIDATION_FAILURE_TTL_SECONDS = 60  # 驗證失敗只短暫快取，方便修正後重試
+CLIENT_REGISTRY_MAX_ITEMS = 32  # 進程內最多保留的 OpenAI 客戶端 (連線池) 數量，按最近使用淘汰
+
+# 請求調度器 (每個存檔一個)：限流、重試、熔斷與對沖請求
+SCHEDULER_RATE_PER_SECOND = 2.0
+SCHEDULER_BURST = 4
+SCHEDULER_MAX_RETRIES = 3
+SCHEDULER_BACKOFF_BASE = 1.0
+SCHEDULER_BACKOFF_MAX = 30.0
+SCHEDULER_FAILURE_THRESHOLD = 5  # 連續失敗次數達到此值即熔斷
+SCHEDULER_RESET_TIMEOUT = 30.0  # 熔斷後多久允許試探請求
+SCHEDULER_HEDGE_PERCENTILE = 0.9  # 首個請求耗時超過此百分位即發出對沖請求
+SCHEDULER_HEDGE_MIN_SAMPLES = 10
+SCHEDULER_HEDGE_MAX_INFLIGHT = 4  # 同時在途的對沖請求上限 (包括已落敗但仍未返回的請求)，名額用盡時不再對沖
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# 跨會話生成佇列：全局並行上游請求上限 (每個存檔另受其「並行請求上限」限制)，以及完成後任務的保留時間
+QUEUE_MAX_CONCURRENCY = int(os.environ.get("FLUX_QUEUE_MAX_CONCURRENCY", "8"))
+QUEUE_JOB_RETENTION_SECONDS = 600
+QUEUE_POLL_INTERVAL = 1.0  # 生成頁面輪詢任務進度的間隔 (秒)
+
+# 參數掃描：單次掃描的格數上限，以及預估費用用的每張圖像單價 (美元，可在存檔中以 cost_per_image 覆蓋)
+SWEEP_MAX_CELLS = 64
+COST_PER_IMAGE = {"Pollinations.ai": 0.0}
+DEFAULT_COST_PER_IMAGE = float(os.environ.get("FLUX_COST_PER_IMAGE", "0.04"))
+
+# 效能度量：百分位使用最近 METRICS_WINDOW 個樣本；設定 FLUX_METRICS_EXPORT_DIR 後定期導出 metrics.json / metrics.prom
+METRICS_WINDOW = 1000
+METRICS_EXPORT_DIR = os.environ.get("FLUX_METRICS_EXPORT_DIR")
+METRICS_EXPORT_INTERVAL = 10
+
+# 圖像尺寸預設
+IMAGE_SIZES = {
+    "自定義...": "Custom", "1024x1024": "正方形 (1:1)", "1080x1080": "IG 貼文 (1:1)",
+    "1080x1350": "IG 縱向 (4:5)", "1080x1920": "IG Story (9:16)", "1200x630": "FB 橫向 (1.91:1)",
+}
+
+# 風格預設
+STYLE_PRESETS = {
+    # 基礎風格
+    "無": "", "電影感": "cinematic, dramatic lighting, high detail, sharp focus, epic",
+    "動漫風": "anime, manga style, vibrant colors, clean line art, studio ghibli", "賽博龐克": "cyberpunk, neon lights, futuristic city, high-tech, Blade Runner",
+    # 藝術流派
+    "印象派": "impressionism, soft light, visible brushstrokes, Monet style", "超現實主義": "surrealism, dreamlike, bizarre, Salvador Dali style",
+    "普普藝術": "pop art, bold colors, comic book style, Andy Warhol", "水墨畫": "ink wash painting, traditional chinese art, minimalist, zen",
+    # 數位與遊戲風格
+    "3D 模型": "3d model, octane render, unreal engine, hyperdetailed, 4k", "像素藝術": "pixel art, 16-bit, retro gaming style, sprite sheet",
+    "低面建模": "low poly, simple shapes, vibrant color palette, isometric", "矢量圖": "vector art, flat design, clean lines, graphic illustration",
+    # 幻想與特定風格
+    "蒸汽龐克": "steampunk, victorian, gears, clockwork, intricate details", "黑暗奇幻": "dark fantasy, gothic, grim, lovecraftian horror, moody lighting",
+    "水彩畫": "watercolor painting, soft wash, blended colors, delicate", "剪紙藝術": "paper cut-out, layered paper, papercraft, flat shapes",
+    "奇幻藝術": "fantasy art, epic, detailed, magical, lord of the rings", "漫畫書": "comic book art, halftone dots, bold outlines, graphic novel style",
+    "線條藝術": "line art, monochrome, minimalist, clean lines", "霓虹龐克": "neon punk, fluorescent, glowing, psychedelic, vibrant",
+    "黑白線條藝術": "black and white line art, minimalist, clean vector, coloring book style",
+}
+
+# **FIX**: Add the latest FLUX models to the hardcoded list
+API_PROVIDERS = {
+    "Pollinations.ai": {
+        "name": "Pollinations.ai Studio", 
+        "base_url_default": "https://image.pollinations.ai", 
+        "icon": "🌸",
+        "hardcoded_models": {
+            "flux-1.1-pro": {"name": "Flux 1.1 Pro", "icon": "🏆"},
+            "flux.1-kontext-pro": {"name": "Flux.1 Kontext Pro", "icon": "🧠"},
+            "flux.1-kontext-max": {"name": "Flux.1 Kontext Max", "icon": "👑"},
+            "flux-dev": {"name": "Flux Dev", "icon": "🛠️"},
+            "flux-schnell": {"name": "Flux Schnell", "icon": "⚡"}
+        }
+    },
+    "NavyAI": {"name": "NavyAI", "base_url_default": "https://api.navy/v1", "icon": "⚓"},
+    "OpenAI Compatible": {"name": "OpenAI 兼容 API", "base_url_default": "https://api.openai.com/v1", "icon": "🤖"},
+}
+
+BASE_FLUX_MODELS = {"flux.1-schnell": {"name": "FLUX.1 Schnell", "icon": "⚡", "priority": 1}}
+
+# 未配置 secrets 時使用的預設存檔
+DEFAULT_API_PROFILES = {"預設 Pollinations": {'provider': 'Pollinations.ai', 'api_key': '', 'base_url': 'https://image.pollinations.ai', 'validated': True, 'pollinations_auth_mode': '免費', 'pollinations_token': '', 'pollinations_referrer': ''}}
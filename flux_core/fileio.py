@@ -0,0 +1,15 @@
+"""文件寫入工具：圖像存儲、結果快取、度量導出與批量輸出共用的原子寫入。"""
+import os
+import uuid
+from typing import Union
+
+def write_atomic(path: str, data: Union[bytes, str]):
+    """先寫入同目錄下的臨時文件再 os.replace，讀取方 (包括其他進程) 不會看到寫了一半的文件；str 以 UTF-8 編碼。"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f: f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
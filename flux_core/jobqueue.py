@@ -0,0 +1,163 @@
+"""跨會話生成佇列：全局與每個存檔的並行上限、各會話之間輪轉的公平調度，以及相同在途請求的合併。
+
+任務在背景執行緒中運行，結果寫入 ImageStore 後只保存圖像引用；會話只需記住任務 id，頁面重跑後即可繼續輪詢。
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import QUEUE_JOB_RETENTION_SECONDS, QUEUE_MAX_CONCURRENCY
+from .metrics import get_metrics
+from .providers import _shared, credential_key, execute_generation_request, get_image_store, get_max_concurrency, plan_generation_requests
+from .storage import ResultCache
+
+class GenerationJob:
+    """一次批量生成；results 按圖像序號保存 (是否成功, 圖像引用或錯誤訊息, 耗時秒數)，未完成的格位為 None。"""
+
+    def __init__(self, key: str, cfg: Dict, client, profile_name: str, params: Dict, session_id: str):
+        self.id, self.key = uuid.uuid4().hex, key
+        self.cfg, self.client, self.profile_name, self.params = cfg, client, profile_name, params
+        self.n = int(params.get("n", 1))
+        self.results: List[Optional[Tuple[bool, str, float]]] = [None] * self.n
+        self.status = "queued"  # queued -> running -> done / cancelled
+        self.sessions: Set[str] = {session_id}  # 合併後共用此任務的會話
+        self.submitted_at, self.started_at, self.finished_at = time.time(), None, None
+        self.pending_requests = 0
+
+    @property
+    def completed(self) -> int: return sum(result is not None for result in self.results)
+
+    @property
+    def finished(self) -> bool: return self.status in ("done", "cancelled")
+
+    def image_refs(self) -> List[str]: return [result[1] for result in self.results if result and result[0]]
+
+class _Request:
+    __slots__ = ("job", "indices", "params", "limit_key", "limit")
+
+    def __init__(self, job: GenerationJob, indices: List[int], params: Dict):
+        self.job, self.indices, self.params = job, indices, params
+        self.limit_key = (job.profile_name, job.cfg.get('base_url', ''))
+        self.limit = get_max_concurrency(job.cfg)
+
+class GenerationQueue:
+    """進程內共用的生成佇列。
+
+    每個會話有各自的 FIFO 佇列；空出並行名額時按會話輪轉取出下一個上游請求 (Pollinations 每張圖一個，OpenAI 兼容 API 每批一個)，
+    因此一個會話提交大批量時不會餓死其他會話。
+    """
+
+    def __init__(self, max_concurrency: int = QUEUE_MAX_CONCURRENCY, retention: float = QUEUE_JOB_RETENTION_SECONDS):
+        self.max_concurrency, self.retention = max(1, max_concurrency), retention
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="flux-queue")
+        self._sessions: "OrderedDict[str, deque]" = OrderedDict()  # 會話 id -> 待發請求；順序即輪轉順序
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._inflight: Dict[str, GenerationJob] = {}  # 合併鍵 -> 排隊或運行中的任務
+        self._running = 0
+        self._running_by_limit: Dict[Tuple[str, str], int] = {}
+        self.submitted = self.coalesced = 0
+
+    @staticmethod
+    def coalesce_key(cfg: Dict, params: Dict) -> str:
+        # 憑證不同的請求不合併，避免用一個用戶的密鑰為另一個用戶付費
+        return f"{ResultCache.make_key(cfg, params)}:{credential_key(cfg.get('provider'), cfg.get('base_url', ''), cfg.get('api_key', ''))[2][:16]}"
+
+    def submit(self, session_id: str, cfg: Dict, client, profile_name: str, params: Dict) -> GenerationJob:
+        """提交任務；若已有相同的請求在排隊或運行中，直接返回該任務而不再調用上游。"""
+        key = self.coalesce_key(cfg, params)
+        with self._lock:
+            self._prune()
+            self.submitted += 1
+            job = self._inflight.get(key)
+            if job is not None:
+                job.sessions.add(session_id)
+                self.coalesced += 1
+                return job
+            job = GenerationJob(key, dict(cfg), client, profile_name, params, session_id)
+            plan = plan_generation_requests(cfg, **params)
+            job.pending_requests = len(plan)
+            self._jobs[job.id] = self._inflight[key] = job
+            self._sessions.setdefault(session_id, deque()).extend(_Request(job, indices, request_params) for indices, request_params in plan)
+            self._pump()
+            return job
+
+    def get(self, job_id: str) -> Optional[GenerationJob]:
+        with self._lock: return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str, session_id: str):
+        """會話放棄任務；沒有其他會話共用時撤回尚未發出的請求 (已發出的請求仍會完成)。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished: return
+            job.sessions.discard(session_id)
+            if job.sessions: return
+            for owner, pending in list(self._sessions.items()):
+                withdrawn = [request for request in pending if request.job is job]
+                for request in withdrawn: pending.remove(request)
+                if not pending: del self._sessions[owner]
+                job.pending_requests -= len(withdrawn)
+            # 結果已不完整，之後的相同請求不再合併到此任務
+            if self._inflight.get(job.key) is job: del self._inflight[job.key]
+            if job.pending_requests == 0: self._finish(job, "cancelled")
+
+    def position(self, job: GenerationJob) -> Optional[int]:
+        """任務下一個待發請求之前還有多少個請求 (按輪轉順序估算，不考慮存檔上限)；沒有待發請求時返回 None。"""
+        with self._lock:
+            order = list(self._sessions.items())
+            for owner_index, (_, pending) in enumerate(order):
+                depth = next((i for i, request in enumerate(pending) if request.job is job), None)
+                if depth is None: continue
+                # 第 depth 輪輪到此請求：之前的會話各取 depth + 1 個，之後的會話各取 depth 個
+                return depth + sum(min(len(other), depth + (i < owner_index)) for i, (_, other) in enumerate(order) if i != owner_index)
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"running": self._running, "queued": sum(len(pending) for pending in self._sessions.values()), "sessions": len(self._sessions),
+                    "jobs": sum(not job.finished for job in self._jobs.values()), "submitted": self.submitted, "coalesced": self.coalesced, "max_concurrency": self.max_concurrency}
+
+    def _pump(self):
+        # 調用者須持有 self._lock；按會話輪轉發出請求，直到全局名額用盡或剩餘請求都受存檔上限阻擋
+        while self._running < self.max_concurrency:
+            for session_id, pending in self._sessions.items():
+                if self._running_by_limit.get(pending[0].limit_key, 0) < pending[0].limit: break
+            else: return
+            request = pending.popleft()
+            self._sessions.move_to_end(session_id)
+            if not pending: del self._sessions[session_id]
+            job = request.job
+            if job.started_at is None:
+                job.status, job.started_at = "running", time.time()
+                get_metrics().observe("queue.wait", job.started_at - job.submitted_at)
+            self._running += 1
+            self._running_by_limit[request.limit_key] = self._running_by_limit.get(request.limit_key, 0) + 1
+            self._pool.submit(self._run, request)
+
+    def _run(self, request: _Request):
+        job = request.job
+        try:
+            results = execute_generation_request(job.cfg, job.client, job.profile_name, request.indices, request.params)
+            stored = [(i, ok, get_image_store().put(payload) if ok else str(payload), elapsed) for i, ok, payload, elapsed in results]
+        except Exception as e: stored = [(i, False, str(e), time.time() - job.submitted_at) for i in request.indices]
+        with self._lock:
+            for i, ok, value, elapsed in stored: job.results[i] = (ok, value, elapsed)
+            job.pending_requests -= 1
+            if job.pending_requests == 0 and not job.finished: self._finish(job, "done" if job.sessions else "cancelled")
+            self._running -= 1
+            self._running_by_limit[request.limit_key] -= 1
+            self._pump()
+
+    def _finish(self, job: GenerationJob, status: str):
+        job.status, job.finished_at = status, time.time()
+        if self._inflight.get(job.key) is job: del self._inflight[job.key]
+        if status == "done": get_metrics().observe("generation.batch", job.finished_at - job.submitted_at)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]: del self._jobs[job_id]
+
+def get_generation_queue() -> GenerationQueue: return _shared(("generation_queue",), GenerationQueue)
@@ -0,0 +1,97 @@
+"""輕量級效能度量：以滾動窗口記錄各階段耗時與位元組數，可導出為 JSON 或 Prometheus 文本格式。"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from .config import METRICS_WINDOW
+from .fileio import write_atomic
+
+class RollingHistogram:
+    """保留最近 window 個樣本用於計算百分位，count / sum 則自進程啟動起累計。"""
+
+    def __init__(self, unit: str, window: int):
+        self.unit = unit
+        self._samples: deque = deque(maxlen=window)
+        self.count, self.total = 0, 0.0
+
+    def observe(self, value: float):
+        self._samples.append(value)
+        self.count += 1; self.total += value
+
+    def snapshot(self) -> Dict:
+        samples = sorted(self._samples)
+        pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+        return {"unit": self.unit, "count": self.count, "sum": self.total, "window": len(samples), "mean": sum(samples) / len(samples) if samples else None,
+                "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": samples[-1] if samples else None}
+
+class MetricsRegistry:
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, RollingHistogram] = {}
+        self._last_export = float("-inf")
+
+    def observe(self, name: str, value: float, unit: str = "seconds"):
+        with self._lock:
+            if name not in self._histograms: self._histograms[name] = RollingHistogram(unit, self.window)
+            self._histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock: self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock: return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+    def to_json(self) -> str: return json.dumps({"timestamp": time.time(), "metrics": self.snapshot()}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        # 滾動百分位對應 Prometheus 的 summary 類型；_sum / _count 為單調遞增的累計值
+        lines = []
+        for name, snap in self.snapshot().items():
+            metric = f"flux_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_{snap['unit']}"
+            lines += [f"# HELP {metric} {name} ({snap['unit']}, 最近 {self.window} 個樣本的百分位)", f"# TYPE {metric} summary"]
+            for q in ("p50", "p90", "p99"):
+                if snap[q] is not None: lines.append(f'{metric}{{quantile="0.{q[1:]}"}} {snap[q]:.6g}')
+            lines += [f"{metric}_sum {snap['sum']:.6g}", f"{metric}_count {snap['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def maybe_export(self, directory: Optional[str], interval: float):
+        """距上次導出超過 interval 秒時才寫檔，避免每次重跑都寫入磁碟。"""
+        if not directory: return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_export < interval: return
+            self._last_export = now
+        self.export(directory)
+
+    def export(self, directory: str):
+        """寫入 metrics.json 與 metrics.prom (可供 node_exporter 的 textfile collector 採集)。"""
+        os.makedirs(directory, exist_ok=True)
+        for filename, content in (("metrics.json", self.to_json()), ("metrics.prom", self.to_prometheus())):
+            write_atomic(os.path.join(directory, filename), content)
+
+_metrics = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry: return _metrics
+
+def deep_sizeof(obj, _seen: Optional[set] = None) -> int:
+    """估算容器及其內容佔用的記憶體位元組數 (用於監控 session_state 大小)。"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen: return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict): size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)): size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
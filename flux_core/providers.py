@@ -0,0 +1,229 @@
+"""供應商調用邏輯：客戶端與連線池、模型發現、密鑰驗證與圖像生成。不依賴 Streamlit，可供 Web 介面與命令行共用。"""
+import base64
+import hashlib
+import os
+import random
+import threading
+import time
+import tomllib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import (API_PROVIDERS, BASE_FLUX_MODELS, CLIENT_REGISTRY_MAX_ITEMS, DEFAULT_API_PROFILES, DEFAULT_MAX_CONCURRENCY, IMAGE_STORE_DIR, IMAGE_STORE_MAX_BYTES,
+                     MAX_BATCH_SIZE, MAX_SEED, MODEL_CACHE_TTL_SECONDS, RESULT_CACHE_DIR, RESULT_CACHE_MEMORY_ITEMS, RESULT_CACHE_TTL_SECONDS,
+                     STYLE_PRESETS, VALIDATION_FAILURE_TTL_SECONDS)
+from .metrics import get_metrics
+from .scheduler import CircuitOpenError, ProviderHTTPError, ProviderScheduler
+from .storage import ImageStore, ResultCache, TTLCache
+
+if TYPE_CHECKING: from openai import OpenAI
+
+# 進程內共用的單例 (Streamlit 每次重跑只會重新執行 app.py，已導入的模組會保留)
+_shared_lock = threading.RLock()
+_shared_instances: Dict[Tuple, object] = {}
+
+def _shared(key: Tuple, factory: Callable[[], object]):
+    with _shared_lock:
+        if key not in _shared_instances: _shared_instances[key] = factory()
+        return _shared_instances[key]
+
+def get_image_store() -> ImageStore: return _shared(("image_store",), lambda: ImageStore(IMAGE_STORE_DIR, IMAGE_STORE_MAX_BYTES))
+
+def get_result_cache() -> ResultCache: return _shared(("result_cache",), lambda: ResultCache(RESULT_CACHE_DIR, get_image_store(), RESULT_CACHE_MEMORY_ITEMS, RESULT_CACHE_TTL_SECONDS))
+
+def get_model_cache() -> TTLCache: return _shared(("model_cache",), lambda: TTLCache(MODEL_CACHE_TTL_SECONDS))
+
+def get_validation_cache() -> TTLCache: return _shared(("validation_cache",), lambda: TTLCache(MODEL_CACHE_TTL_SECONDS))
+
+def get_scheduler(profile_name: str, base_url: str) -> ProviderScheduler: return _shared(("scheduler", profile_name, base_url), ProviderScheduler)
+
+def load_api_profiles(path: Optional[str] = None) -> Dict[str, Dict]:
+    """在 Streamlit 之外讀取 secrets.toml 中的 API 存檔；未配置時返回預設的 Pollinations 存檔。"""
+    path = path or os.path.join(".streamlit", "secrets.toml")
+    try:
+        with open(path, "rb") as f: profiles = tomllib.load(f).get("api_profiles", {})
+    except FileNotFoundError: profiles = {}
+    return {name: dict(cfg) for name, cfg in profiles.items()} or {name: dict(cfg) for name, cfg in DEFAULT_API_PROFILES.items()}
+
+def build_final_prompt(prompt: str, style: str) -> str:
+    return f"{prompt}, {STYLE_PRESETS[style]}" if style != "無" and STYLE_PRESETS.get(style) else prompt
+
+def default_models(provider: str) -> Dict[str, Dict]:
+    if provider == "Pollinations.ai": return dict(API_PROVIDERS['Pollinations.ai'].get('hardcoded_models', {}))
+    return dict(BASE_FLUX_MODELS)
+
+def credential_key(provider: str, base_url: str, api_key: str) -> Tuple[str, str, str]:
+    # 鍵中只保留密鑰哈希，避免明文密鑰常駐於快取鍵
+    return (provider, str(base_url).rstrip('/'), hashlib.sha256((api_key or '').encode()).hexdigest())
+
+class ClientRegistry:
+    """進程內共用的 OpenAI 客戶端註冊表，同一憑證的所有會話重用同一個客戶端及其連線池；超過 max_items 時淘汰最久未用的客戶端。"""
+
+    def __init__(self, max_items: int = CLIENT_REGISTRY_MAX_ITEMS):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[Tuple[str, str, str], OpenAI]" = OrderedDict()
+
+    def get(self, provider: str, base_url: str, api_key: str) -> "OpenAI":
+        key = credential_key(provider, base_url, api_key)
+        with self._lock:
+            if key not in self._clients:
+                # openai SDK 導入耗時較長，只在首次需要 OpenAI 兼容客戶端時才導入，純 Pollinations 部署的冷啟動不受影響
+                from openai import OpenAI
+                self._clients[key] = OpenAI(api_key=api_key, base_url=base_url)
+                # 只移除引用而不關閉，正在佇列中使用舊客戶端的請求仍可完成
+                while len(self._clients) > self.max_items: self._clients.popitem(last=False)
+            self._clients.move_to_end(key)
+            return self._clients[key]
+
+    def invalidate(self, provider: str, base_url: str, api_key: str):
+        with self._lock: self._clients.pop(credential_key(provider, base_url, api_key), None)
+
+def get_client_registry() -> ClientRegistry: return _shared(("client_registry",), ClientRegistry)
+
+def fetch_model_ids(provider: str, base_url: str, api_key: str = '') -> List[str]:
+    cache_key = credential_key(provider, base_url, api_key)
+    model_ids = get_model_cache().get(cache_key)
+    if model_ids is not None: return model_ids
+    with get_metrics().timer("models.fetch"):
+        if provider == "Pollinations.ai":
+            response = requests.get(f"{base_url}/models", timeout=10)
+            if not response.ok: raise RuntimeError(f"無法從 Pollinations 獲取模型列表: HTTP {response.status_code}")
+            model_ids = list(response.json())
+        else: model_ids = [model.id for model in get_client_registry().get(provider, base_url, api_key).models.list().data]
+    get_model_cache().set(cache_key, model_ids)
+    return model_ids
+
+def invalidate_model_caches(provider: str, base_url: str, api_key: str = ''):
+    key = credential_key(provider, base_url, api_key)
+    get_model_cache().invalidate(key); get_validation_cache().invalidate(key)
+
+def models_from_ids(provider: str, model_ids: List[str]) -> Dict[str, Dict]:
+    discovered = {}
+    if provider == "Pollinations.ai":
+        for model_name in model_ids: discovered[model_name] = {"name": model_name.replace('-', ' ').title(), "icon": "🌸"}
+    else:
+        for model_id in model_ids:
+            if 'flux' in model_id.lower() or 'kontext' in model_id.lower():
+                icon = "⚡" if 'flux' in model_id.lower() else "🧠"
+                discovered[model_id] = {"name": model_id.replace('-', ' ').replace('_', ' ').title(), "icon": icon}
+    return discovered
+
+def validate_api_key(api_key: str, base_url: str, provider: str) -> Tuple[bool, str]:
+    if provider == "Pollinations.ai": return True, "Pollinations.ai 無需驗證"
+    validation_cache = get_validation_cache()
+    cache_key = credential_key(provider, base_url, api_key)
+    if (cached := validation_cache.get(cache_key)) is not None: return cached
+    with get_metrics().timer("models.validate"):
+        try: fetch_model_ids(provider, base_url, api_key); result = (True, "API 密鑰驗證成功")
+        except Exception as e: result = (False, f"API 驗證失敗: {e}")
+    # 驗證失敗的密鑰不保留客戶端，避免每個輸錯的密鑰都佔用一個連線池
+    if not result[0]: get_client_registry().invalidate(provider, base_url, api_key)
+    validation_cache.set(cache_key, result, ttl=None if result[0] else VALIDATION_FAILURE_TTL_SECONDS)
+    return result
+
+def _new_http_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter); session.mount("http://", adapter)
+    return session
+
+def get_http_session(profile_name: str, base_url: str, pool_size: int) -> requests.Session:
+    # 每個存檔共用一個 keep-alive 連線池，避免每張圖都重新進行 TLS 握手
+    return _shared(("http_session", profile_name, base_url, pool_size), lambda: _new_http_session(pool_size))
+
+def get_max_concurrency(cfg: Dict) -> int:
+    try: return max(1, min(int(cfg.get('max_concurrency', DEFAULT_MAX_CONCURRENCY)), MAX_BATCH_SIZE))
+    except (TypeError, ValueError): return DEFAULT_MAX_CONCURRENCY
+
+def request_pollinations_image(session: requests.Session, cfg: Dict, params: Dict) -> bytes:
+    prompt = params.get("prompt", "")
+    if (neg_prompt := params.get("negative_prompt")): prompt += f" --no {neg_prompt}"
+    width, height = str(params.get("size", "1024x1024")).split('x')
+    api_params = {k: v for k, v in {"model": params.get("model"), "width": width, "height": height}.items() if v}
+    # seed=0 也是固定種子，只有布林開關按真假過濾
+    if params.get("seed") is not None: api_params["seed"] = params["seed"]
+    api_params.update({flag: params[flag] for flag in ("nologo", "private", "enhance", "safe") if params.get(flag)})
+    headers = {}
+    auth_mode = cfg.get('pollinations_auth_mode', '免費')
+    if auth_mode == '令牌' and cfg.get('pollinations_token'): headers['Authorization'] = f"Bearer {cfg['pollinations_token']}"
+    elif auth_mode == '域名' and cfg.get('pollinations_referrer'): headers['Referer'] = cfg['pollinations_referrer']
+    metrics = get_metrics()
+    start = time.perf_counter()
+    # stream=True 讓響應頭到達即返回，從而分開記錄首位元組時間 (含 DNS / TLS 與供應商排隊) 和響應體下載時間
+    response = session.get(f"{cfg['base_url']}/prompt/{quote(prompt)}?{urlencode(api_params)}", headers=headers, timeout=120, stream=True)
+    metrics.observe("pollinations.ttfb", time.perf_counter() - start)
+    if not response.ok:
+        response.close()
+        raise ProviderHTTPError(response.status_code, response.headers.get('Retry-After'))
+    with metrics.timer("pollinations.download"): content = response.content
+    metrics.observe("pollinations.response", len(content), unit="bytes")
+    return content
+
+def fetch_pollinations_image(session: requests.Session, scheduler: ProviderScheduler, cfg: Dict, params: Dict) -> Tuple[bool, any]:
+    try: return True, scheduler.call(lambda: request_pollinations_image(session, cfg, params), hedge=bool(cfg.get('hedge_requests')))
+    except (ProviderHTTPError, CircuitOpenError) as e: return False, str(e)
+    except Exception as e: return False, e
+
+def result_image_bytes(image_obj) -> bytes:
+    # Pollinations 直接返回原始位元組；OpenAI 兼容 API 返回 b64_json
+    if getattr(image_obj, 'content', None): return image_obj.content
+    with get_metrics().timer("openai.b64_decode"): data = base64.b64decode(image_obj.b64_json)
+    get_metrics().observe("openai.image", len(data), unit="bytes")
+    return data
+
+def plan_generation_requests(cfg: Dict, **params) -> List[Tuple[List[int], Dict]]:
+    """把一批生成拆成上游請求 (圖像序號, 請求參數)：Pollinations 每張圖一個請求並分配種子，OpenAI 兼容 API 整批一個請求。"""
+    n_images = params.get("n", 1)
+    if cfg.get('provider') != "Pollinations.ai": return [(list(range(n_images)), params)]
+    base_seed = params.get("seed")
+    return [([i], {**params, "seed": (base_seed + i) % (MAX_SEED + 1) if base_seed is not None else random.randint(0, MAX_SEED)}) for i in range(n_images)]
+
+def execute_generation_request(cfg: Dict, client, profile_name: str, indices: List[int], params: Dict) -> List[Tuple[int, bool, any, float]]:
+    """執行 plan_generation_requests 產生的單個上游請求，返回其中每張圖的 (序號, 是否成功, 圖像位元組或錯誤, 耗時秒數)。"""
+    scheduler = get_scheduler(profile_name, cfg.get('base_url', ''))
+    start = time.time()
+    if cfg.get('provider') == "Pollinations.ai":
+        session = get_http_session(profile_name, cfg['base_url'], get_max_concurrency(cfg))
+        ok, payload = fetch_pollinations_image(session, scheduler, cfg, params)
+        elapsed = time.time() - start
+        if ok: get_metrics().observe("generation.image", elapsed)
+        return [(indices[0], ok, payload, elapsed)]
+    # OpenAI 兼容 API 一次請求返回整批圖像
+    try:
+        sdk_params = {"model": params.get("model"), "prompt": params.get("prompt"), "negative_prompt": params.get("negative_prompt"), "size": str(params.get("size")), "n": len(indices), "response_format": "b64_json"}
+        sdk_params = {k: v for k, v in sdk_params.items() if v is not None and v != ""}
+        # 生成請求的重試由 ProviderScheduler 負責，只對此調用關閉 SDK 內建重試以免重複 (模型列表仍保留 SDK 重試)
+        generate_client = client.with_options(max_retries=0)
+        def timed_generate():
+            with get_metrics().timer("openai.request"): return generate_client.images.generate(**sdk_params)
+        data = scheduler.call(timed_generate, hedge=bool(cfg.get('hedge_requests'))).data
+    except Exception as e: return [(i, False, str(e), time.time() - start) for i in indices]
+    get_metrics().observe("generation.image", time.time() - start)
+    results = [(i, True, result_image_bytes(image), time.time() - start) for i, image in zip(indices, data)]
+    return results + [(i, False, "API 返回的圖像數量不足", time.time() - start) for i in indices[len(data):]]
+
+def iter_generated_images(cfg: Dict, client, profile_name: str = '', **params) -> Iterator[Tuple[int, bool, any, float]]:
+    """每完成一張即產出 (序號, 是否成功, 圖像位元組或錯誤, 耗時秒數)，順序為完成順序。"""
+    plan = plan_generation_requests(cfg, **params)
+    with ThreadPoolExecutor(max_workers=min(get_max_concurrency(cfg), len(plan))) as pool:
+        futures = [pool.submit(execute_generation_request, cfg, client, profile_name, indices, request_params) for indices, request_params in plan]
+        for future in as_completed(futures): yield from future.result()
+
+def generate_images_with_retry(cfg: Dict, client, profile_name: str = '', **params) -> Tuple[bool, any]:
+    """收集整批結果；成功時返回的 Response 帶有 data 及逐張的 errors 訊息。"""
+    is_pollinations = cfg.get('provider') == "Pollinations.ai"
+    slots, errors = [None] * params.get("n", 1), []
+    for i, ok, payload, _ in iter_generated_images(cfg, client, profile_name, **params):
+        if ok: slots[i] = type('Image', (object,), {'b64_json': None, 'content': payload})
+        elif not is_pollinations: errors.append(str(payload))
+        elif isinstance(payload, Exception): errors.append(f"第 {i+1} 張圖片生成時出錯: {payload}")
+        else: errors.append(f"第 {i+1} 張圖片生成失敗: {payload}")
+    generated_images = [image for image in slots if image is not None]
+    if generated_images: return True, type('Response', (object,), {'data': generated_images, 'errors': errors})
+    return False, errors[0] if errors and not is_pollinations else "所有圖片生成均失敗。"
@@ -0,0 +1,180 @@
+"""供應商請求調度：令牌桶限流、重試退避、熔斷器與對沖請求。"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+
+from .config import (RETRYABLE_STATUS_CODES, SCHEDULER_BACKOFF_BASE, SCHEDULER_BACKOFF_MAX, SCHEDULER_BURST, SCHEDULER_FAILURE_THRESHOLD,
+                     SCHEDULER_HEDGE_MAX_INFLIGHT, SCHEDULER_HEDGE_MIN_SAMPLES, SCHEDULER_HEDGE_PERCENTILE, SCHEDULER_MAX_RETRIES,
+                     SCHEDULER_RATE_PER_SECOND, SCHEDULER_RESET_TIMEOUT)
+from .metrics import get_metrics
+
+class ProviderHTTPError(Exception):
+    def __init__(self, status_code: int, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code, self.retry_after = status_code, retry_after
+
+class CircuitOpenError(Exception):
+    pass
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate, self.capacity = rate, capacity
+        self._tokens, self._updated = float(capacity), time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """阻塞直到取得一個令牌，返回等待的秒數。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay); waited += delay
+
+def parse_retry_after(value) -> Optional[float]:
+    if not value: return None
+    try: return max(0.0, float(value))
+    except (TypeError, ValueError): pass
+    try: return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError): return None
+
+def classify_error(exc: Exception) -> Tuple[bool, bool, Optional[float]]:
+    """返回 (可重試, 計入熔斷, Retry-After 秒數)；同時識別 requests 與 OpenAI SDK 的異常。"""
+    status = getattr(exc, 'status_code', None)
+    if status is None and isinstance(exc, (requests.ConnectionError, requests.Timeout)): return True, True, None
+    if status is None and type(exc).__name__ in ("APIConnectionError", "APITimeoutError"): return True, True, None
+    if status is None: return False, False, None
+    retry_after = getattr(exc, 'retry_after', None)
+    if retry_after is None: retry_after = getattr(getattr(exc, 'response', None), 'headers', {}).get('retry-after')
+    return status in RETRYABLE_STATUS_CODES, status >= 500, parse_retry_after(retry_after)
+
+class ProviderScheduler:
+    """單一存檔的請求調度器：令牌桶限流、帶抖動且遵循 Retry-After 的指數退避、熔斷器，以及可選的對沖請求。"""
+
+    def __init__(self, rate: float = SCHEDULER_RATE_PER_SECOND, burst: int = SCHEDULER_BURST, max_retries: int = SCHEDULER_MAX_RETRIES):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=200)
+        self._consecutive_failures, self._opened_at, self._probing = 0, None, False
+        self._hedge_slots = threading.BoundedSemaphore(SCHEDULER_HEDGE_MAX_INFLIGHT)
+        self.counters = {k: 0 for k in ("requests", "successes", "failures", "retries", "rate_limited", "circuit_rejections", "hedged", "hedge_wins", "wasted")}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock: self.counters[name] += amount
+
+    def circuit_state(self) -> str:
+        with self._lock:
+            if self._opened_at is None: return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= SCHEDULER_RESET_TIMEOUT else "open"
+
+    def _admit(self):
+        with self._lock:
+            if self._opened_at is None: return
+            if time.monotonic() - self._opened_at < SCHEDULER_RESET_TIMEOUT or self._probing:
+                self.counters["circuit_rejections"] += 1
+                raise CircuitOpenError("供應商暫時不可用 (熔斷中)，請稍後再試")
+            self._probing = True  # 半開狀態只放行一個試探請求
+
+    def _record(self, ok: bool, latency: float = 0.0, trips_breaker: bool = False):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._latencies.append(latency)
+                self._consecutive_failures, self._opened_at = 0, None
+            elif trips_breaker:
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= SCHEDULER_FAILURE_THRESHOLD or self._opened_at is not None: self._opened_at = time.monotonic()
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        with self._lock: samples = sorted(self._latencies)
+        if not samples: return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def _attempt(self, fn: Callable[[], any], started: Optional[threading.Event] = None):
+        get_metrics().observe("scheduler.rate_limit_wait", self.bucket.acquire())
+        if started is not None: started.set()
+        self._count("requests")
+        start = time.monotonic()
+        try: result = fn()
+        except Exception as e:
+            retryable, trips_breaker, _ = classify_error(e)
+            if getattr(e, 'status_code', None) == 429: self._count("rate_limited")
+            self._record(False, trips_breaker=trips_breaker)
+            raise
+        self._record(True, time.monotonic() - start)
+        return result
+
+    @staticmethod
+    def _spawn(fn: Callable, *args) -> Future:
+        # 每個請求使用獨立執行緒而非共用的固定大小執行緒池，首個請求不會因排隊而被誤判為慢請求
+        future = Future()
+        def run():
+            try: future.set_result(fn(*args))
+            except BaseException as e: future.set_exception(e)
+        threading.Thread(target=run, name="hedge", daemon=True).start()
+        return future
+
+    def _hedged_attempt(self, fn: Callable[[], any]):
+        hedge_after = self.latency_percentile(SCHEDULER_HEDGE_PERCENTILE) if len(self._latencies) >= SCHEDULER_HEDGE_MIN_SAMPLES else None
+        if hedge_after is None: return self._attempt(fn)
+        started = threading.Event()
+        primary = self._spawn(self._attempt, fn, started)
+        primary.add_done_callback(lambda _: started.set())
+        # 從請求實際發出時開始計時，限流等待不計入
+        started.wait()
+        done, _ = wait([primary], timeout=hedge_after)
+        # 對沖名額用盡 (包括落敗請求仍未返回) 時只等待首個請求，避免對沖本身造成排隊與浪費
+        if done or not self._hedge_slots.acquire(blocking=False): return primary.result()
+        self._count("hedged")
+        backup = self._spawn(self._attempt, fn)
+        outstanding, outstanding_lock = [2], threading.Lock()
+        def release_slot(_):
+            # 兩個請求都返回後才歸還名額，落敗請求仍佔用名額
+            with outstanding_lock:
+                outstanding[0] -= 1
+                if outstanding[0]: return
+            self._hedge_slots.release()
+        primary.add_done_callback(release_slot); backup.add_done_callback(release_slot)
+        pending, error = {primary, backup}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 另一個仍在進行的請求無法中止，其結果將被丟棄
+                    if pending: self._count("wasted")
+                    if future is backup: self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, fn: Callable[[], any], hedge: bool = False):
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            try:
+                result = self._hedged_attempt(fn) if hedge else self._attempt(fn)
+                self._count("successes")
+                return result
+            except Exception as e:
+                retryable, _, retry_after = classify_error(e)
+                if not retryable or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                backoff = random.uniform(0, min(SCHEDULER_BACKOFF_MAX, SCHEDULER_BACKOFF_BASE * 2 ** attempt))
+                self._count("retries")
+                time.sleep(min(SCHEDULER_BACKOFF_MAX, max(backoff, retry_after or 0)))
+
+    def stats(self) -> Dict:
+        with self._lock: counters = dict(self.counters)
+        return {**counters, "circuit": self.circuit_state(), "p50": self.latency_percentile(0.5), "p95": self.latency_percentile(0.95)}
@@ -0,0 +1,200 @@
+"""磁碟圖像存儲、生成結果快取與跨會話 TTL 快取。"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from .config import THUMBNAIL_CACHE_ITEMS, THUMBNAIL_MAX_SIDE
+from .fileio import write_atomic
+from .metrics import get_metrics
+
+class ImageStore:
+    """以 SHA-256 內容哈希為鍵的磁碟圖像存儲，存放原始位元組並按總大小進行 LRU 淘汰。"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root, self.max_bytes = root, max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # digest -> 位元組數，由舊到新
+        self._thumbs: "OrderedDict[str, bytes]" = OrderedDict()
+        self.thumb_root = os.path.join(root, "thumbs")
+        os.makedirs(self.thumb_root, exist_ok=True)
+        existing = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and re.fullmatch(r"[0-9a-f]{64}", name): existing.append((os.path.getmtime(path), name, os.path.getsize(path)))
+        for _, name, size in sorted(existing): self._entries[name] = size
+        self._total = sum(self._entries.values())
+
+    def _path(self, digest: str) -> str: return os.path.join(self.root, digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._entries:
+                self._touch(digest)
+                return digest
+            write_atomic(self._path(digest), data)
+            self._entries[digest] = len(data); self._total += len(data)
+            self._evict(keep=digest)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            if digest not in self._entries: return None
+            try:
+                with get_metrics().timer("store.read"), open(self._path(digest), "rb") as f: data = f.read()
+            except OSError:
+                self._total -= self._entries.pop(digest)
+                return None
+            self._touch(digest)
+            return data
+
+    def get_thumbnail(self, digest: str, max_side: int = THUMBNAIL_MAX_SIDE) -> Optional[bytes]:
+        """返回 JPEG 縮圖；每張圖只在首次請求時解碼並縮放一次，其後從記憶體或磁碟讀取。"""
+        key = f"{digest}_{max_side}"
+        with self._lock:
+            if digest not in self._entries: return None
+            if key in self._thumbs:
+                self._thumbs.move_to_end(key)
+                return self._thumbs[key]
+        thumb_path = os.path.join(self.thumb_root, f"{key}.jpg")
+        try:
+            with open(thumb_path, "rb") as f: thumb = f.read()
+        except OSError:
+            data = self.get(digest)
+            if data is None: return None
+            with get_metrics().timer("image.thumbnail_build"):
+                from PIL import Image  # 延遲導入：只有首次生成縮圖時才需要 Pillow
+                img = Image.open(BytesIO(data))
+                img.thumbnail((max_side, max_side))
+                buffer = BytesIO()
+                img.convert("RGB").save(buffer, "JPEG", quality=85)
+                thumb = buffer.getvalue()
+            write_atomic(thumb_path, thumb)
+        with self._lock:
+            self._thumbs[key] = thumb
+            while len(self._thumbs) > THUMBNAIL_CACHE_ITEMS: self._thumbs.popitem(last=False)
+        return thumb
+
+    def __contains__(self, digest: str) -> bool: return digest in self._entries
+
+    def usage(self) -> Tuple[int, int]: return len(self._entries), self._total
+
+    def clear_thumbnails(self):
+        with self._lock:
+            self._thumbs.clear()
+            for name in os.listdir(self.thumb_root):
+                try: os.remove(os.path.join(self.thumb_root, name))
+                except OSError: pass
+
+    def _touch(self, digest: str):
+        self._entries.move_to_end(digest)
+        try: os.utime(self._path(digest))
+        except OSError: pass
+
+    def _evict(self, keep: str):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            digest, size = next(iter(self._entries.items()))
+            if digest == keep: break
+            del self._entries[digest]; self._total -= size
+            try: os.remove(self._path(digest))
+            except OSError: pass
+            for key in [k for k in self._thumbs if k.startswith(digest)]: del self._thumbs[key]
+            for name in os.listdir(self.thumb_root):
+                if name.startswith(digest):
+                    try: os.remove(os.path.join(self.thumb_root, name))
+                    except OSError: pass
+
+class ResultCache:
+    """以標準化請求為鍵的生成結果快取：記憶體 LRU 與磁碟兩層，均帶 TTL，條目只保存 ImageStore 中的圖像引用。"""
+
+    def __init__(self, root: str, image_store: ImageStore, max_items: int, ttl: int):
+        self.root, self.image_store, self.max_items, self.ttl = root, image_store, max_items, ttl
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self.hits = self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(cfg: Dict, params: Dict) -> str:
+        request = {
+            "provider": cfg.get('provider'), "base_url": str(cfg.get('base_url', '')).rstrip('/'), "model": params.get("model"),
+            "prompt": str(params.get("prompt", "")).strip(), "negative_prompt": str(params.get("negative_prompt") or "").strip(),
+            "size": str(params.get("size")), "n": int(params.get("n", 1)), "seed": params.get("seed"),
+            **{flag: bool(params.get(flag)) for flag in ("enhance", "private", "nologo", "safe")},
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def _path(self, key: str) -> str: return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                try:
+                    with open(self._path(key), encoding="utf-8") as f: record = json.load(f)
+                    entry = (record["created"], record["images"])
+                except (OSError, ValueError, KeyError): entry = None
+            # 過期或圖像已被 ImageStore 淘汰的條目視為未命中
+            if entry is None or now - entry[0] > self.ttl or not all(ref in self.image_store for ref in entry[1]):
+                if entry is not None: self._discard(key)
+                self.misses += 1
+                return None
+            self._memory[key] = entry; self._memory.move_to_end(key)
+            self._trim()
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, key: str, image_refs: List[str]):
+        entry = (time.time(), list(image_refs))
+        with self._lock:
+            self._memory[key] = entry; self._memory.move_to_end(key)
+            self._trim()
+            write_atomic(self._path(key), json.dumps({"created": entry[0], "images": entry[1]}))
+
+    def _discard(self, key: str):
+        self._memory.pop(key, None)
+        try: os.remove(self._path(key))
+        except OSError: pass
+
+    def _trim(self):
+        while len(self._memory) > self.max_items: self._memory.popitem(last=False)
+
+def is_cacheable(cfg: Dict, params: Dict) -> bool:
+    # Pollinations 只有在固定種子時結果才可重現
+    return cfg.get('provider') != "Pollinations.ai" or params.get("seed") is not None
+
+class TTLCache:
+    """執行緒安全的跨會話 TTL 快取。"""
+
+    def __init__(self, ttl: int, max_items: int = 256):
+        self.ttl, self.max_items = ttl, max_items
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple, Tuple[float, any]]" = OrderedDict()  # key -> (過期時間, 值)
+
+    def get(self, key: Tuple):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None: return None
+            if entry[0] < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Tuple, value, ttl: Optional[int] = None):
+        with self._lock:
+            self._items[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items: self._items.popitem(last=False)
+
+    def invalidate(self, key: Optional[Tuple] = None):
+        with self._lock:
+            if key is None: self._items.clear()
+            else: self._items.pop(key, None)
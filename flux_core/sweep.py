@@ -0,0 +1,70 @@
+"""參數掃描：對同一提示詞取種子、風格、尺寸與模型的笛卡兒積，把各格合併成盡量少的生成任務並提交到跨會話佇列。"""
+import itertools
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .config import (COST_PER_IMAGE, DEFAULT_COST_PER_IMAGE, MAX_BATCH_SIZE, MAX_SEED, QUEUE_MAX_CONCURRENCY, SCHEDULER_BURST,
+                     SCHEDULER_RATE_PER_SECOND, SWEEP_MAX_CELLS)
+from .jobqueue import GenerationQueue
+from .providers import build_final_prompt, get_max_concurrency, plan_generation_requests
+
+SWEEP_AXES = ("model", "size", "style", "seed")
+
+def parse_seeds(text: str) -> List[int]:
+    """解析以逗號或空白分隔的種子列表，支持 "1-4" 形式的範圍；重複值只保留一次。"""
+    seeds: List[int] = []
+    for token in re.split(r"[,\s，]+", text.strip()):
+        if not token: continue
+        match = re.fullmatch(r"(\d+)(?:-(\d+))?", token)
+        if not match: raise ValueError(f"無效的種子 '{token}'")
+        start, end = int(match.group(1)), int(match.group(2) or match.group(1))
+        if end < start or end > MAX_SEED: raise ValueError(f"種子範圍 '{token}' 無效 (0 - {MAX_SEED})")
+        # 展開範圍前先檢查數量，避免 "0-1000000" 之類的輸入先建出巨大的列表
+        if len(seeds) + end - start + 1 > SWEEP_MAX_CELLS: raise ValueError(f"種子數量不能超過 {SWEEP_MAX_CELLS} 個")
+        seeds.extend(range(start, end + 1))
+    return list(dict.fromkeys(seeds))
+
+def build_sweep_cells(seeds: List[int], styles: List[str], sizes: List[str], models: List[str]) -> List[Dict]:
+    return [{"model": model, "size": size, "style": style, "seed": seed} for model, size, style, seed in itertools.product(models, sizes, styles, seeds)]
+
+def _cell_params(prompt: str, negative_prompt: str, cell: Dict, n: int, seed: Optional[int], flags: Dict) -> Dict:
+    return {"model": cell["model"], "prompt": build_final_prompt(prompt, cell["style"]), "negative_prompt": negative_prompt, "size": cell["size"], "n": n, "seed": seed, **flags}
+
+def plan_sweep(cfg: Dict, prompt: str, negative_prompt: str, cells: List[Dict], **flags) -> List[Tuple[Dict, List[int]]]:
+    """返回 (任務參數, 任務內每張圖對應的格序號)。
+
+    Pollinations 每格一個單張任務，由佇列並行發出；OpenAI 兼容 API 不支持種子，只有種子不同的格其實是同一個請求，
+    因此合併為使用原生 n 參數的任務 (每個最多 MAX_BATCH_SIZE 張)。
+    """
+    if cfg.get('provider') == "Pollinations.ai":
+        return [(_cell_params(prompt, negative_prompt, cell, 1, cell["seed"], flags), [k]) for k, cell in enumerate(cells)]
+    groups: Dict[Tuple[str, str, str], List[int]] = {}
+    for k, cell in enumerate(cells): groups.setdefault((cell["model"], cell["size"], cell["style"]), []).append(k)
+    tasks = []
+    for indices in groups.values():
+        for start in range(0, len(indices), MAX_BATCH_SIZE):
+            chunk = indices[start:start + MAX_BATCH_SIZE]
+            # 種子不會發送給 API，但保留首格的種子讓同組的各個任務有不同的合併鍵，避免被佇列當成同一請求
+            tasks.append((_cell_params(prompt, negative_prompt, cells[chunk[0]], len(chunk), cells[chunk[0]]["seed"], flags), chunk))
+    return tasks
+
+def cost_per_image(cfg: Dict) -> float:
+    try: return float(cfg.get('cost_per_image', COST_PER_IMAGE.get(cfg.get('provider'), DEFAULT_COST_PER_IMAGE)))
+    except (TypeError, ValueError): return DEFAULT_COST_PER_IMAGE
+
+def estimate_sweep(cfg: Dict, tasks: List[Tuple[Dict, List[int]]], latency: Optional[float] = None) -> Dict:
+    """預估上游請求數、並行往返輪數、費用與 (已知近期延遲時的) 耗時；耗時同時考慮調度器的限流速率。"""
+    requests = sum(len(plan_generation_requests(cfg, **params)) for params, _ in tasks)
+    images = sum(len(indices) for _, indices in tasks)
+    parallel = min(QUEUE_MAX_CONCURRENCY, get_max_concurrency(cfg))
+    round_trips = -(-requests // parallel)
+    seconds = max(round_trips * latency, (requests - SCHEDULER_BURST) / SCHEDULER_RATE_PER_SECOND) if latency else None
+    return {"requests": requests, "images": images, "parallel": parallel, "round_trips": round_trips, "cost": images * cost_per_image(cfg), "seconds": seconds}
+
+def submit_sweep(queue: GenerationQueue, session_id: str, cfg: Dict, client, profile_name: str, cells: List[Dict], tasks: List[Tuple[Dict, List[int]]]) -> List[Dict]:
+    """提交所有任務，返回附帶 job_id 與任務內格位 slot 的格列表。相同的在途請求 (包括其他會話的) 會由佇列合併。"""
+    cells = [dict(cell) for cell in cells]
+    for params, indices in tasks:
+        job = queue.submit(session_id, cfg, client, profile_name, params)
+        for slot, k in enumerate(indices): cells[k].update(job_id=job.id, slot=slot)
+    return cells